@@ -1,10 +1,37 @@
 from string_format import *
-import string
 import os
+import sys
+import time
 import math
+import mmap
+import array
+import bisect
+import operator
+import weakref
+import threading
+import importlib
+from string import Formatter
+from collections import OrderedDict
+from collections.abc import MutableSequence
+
+
+# module imported the first time one of its attributes is used. asyncio and process pools are only
+# needed by scripts using tasks or pmap, and importing them takes most of the startup time
+class LazyModule:
+    def __init__(self, name):
+        self.name = name
+
+    def __getattr__(self, attr):
+        return getattr(importlib.import_module(self.name), attr)
+
+asyncio = LazyModule("asyncio")
+process_pool = LazyModule("concurrent.futures.process")
+inspect = LazyModule("inspect")
+hashlib = LazyModule("hashlib")
+serialize = LazyModule("serialize")
 
 DIGITS = "0123456789"
-LETTERS = string.ascii_letters
+LETTERS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
 LETTERS_DIGITS = LETTERS + DIGITS
 
 KEYWORDS = [
@@ -12,6 +39,7 @@ KEYWORDS = [
     "and",
     "or",
     "not",
+    "in",
     "if",
     "elif",
     "else",
@@ -24,7 +52,9 @@ KEYWORDS = [
     "end",
     "break",
     "continue",
-    "return"
+    "return",
+    "yield",
+    "import"
 ]
 
 # Token types
@@ -40,6 +70,9 @@ TT_LPAREN = "LPAREN"
 TT_RPAREN = "RPAREN"
 TT_LSQUARE = "LSQUARE" # [
 TT_RSQUARE = "RSQUARE" # ]
+TT_LBRACE = "LBRACE" # {
+TT_RBRACE = "RBRACE" # }
+TT_COLON = "COLON" # :
 TT_EQUAL = "EQ"
 TT_EE = "EE" # ==
 TT_NE = "NE" # !=
@@ -50,6 +83,7 @@ TT_GTE = "GTE" # >=
 TT_IDENTIFIER = "IDENTIFIER"
 TT_KEYWORD = "KEYWORD"
 TT_COMMA = "COMMA"
+TT_DOT = "DOT" # .
 TT_ARROW = "ARROW"
 TT_NEWLINE = "NEWLINE"
 TT_EOF = "EOF"
@@ -205,6 +239,15 @@ class Lexer:
             elif self.current_char == ']':
                 tokens.append(Token(TT_RSQUARE, pos_start=self.pos))
                 self.advance()
+            elif self.current_char == '{':
+                tokens.append(Token(TT_LBRACE, pos_start=self.pos))
+                self.advance()
+            elif self.current_char == '}':
+                tokens.append(Token(TT_RBRACE, pos_start=self.pos))
+                self.advance()
+            elif self.current_char == ':':
+                tokens.append(Token(TT_COLON, pos_start=self.pos))
+                self.advance()
             elif self.current_char == "^":
                 tokens.append(Token(TT_POW, pos_start=self.pos))
                 self.advance()
@@ -222,6 +265,9 @@ class Lexer:
             elif self.current_char == ",":
                 tokens.append(Token(TT_COMMA, pos_start=self.pos))
                 self.advance()
+            elif self.current_char == ".":
+                tokens.append(Token(TT_DOT, pos_start=self.pos))
+                self.advance()
             else:
                 pos_start = self.pos.copy()
 
@@ -378,6 +424,15 @@ class ForNode:
 		self.pos_end = self.body_node.pos_end
 		self.should_return_null = should_return_null
 
+class ForInNode:
+	def __init__(self, var_name_token, iterable_node, body_node, should_return_null):
+		self.var_name_token = var_name_token
+		self.iterable_node = iterable_node
+		self.body_node = body_node
+		self.pos_start = self.var_name_token.pos_start
+		self.pos_end = self.body_node.pos_end
+		self.should_return_null = should_return_null
+
 class WhileNode:
 	def __init__(self, condition_node, body_node, should_return_null):
 		self.condition_node = condition_node
@@ -388,11 +443,12 @@ class WhileNode:
 
 
 class FunctionNode:
-    def __init__(self, var_name_token, arg_name_tokens, body_node, should_auto_return):
+    def __init__(self, var_name_token, arg_name_tokens, body_node, should_auto_return, is_generator=False):
         self.var_name_token = var_name_token
         self.arg_name_tokens = arg_name_tokens
         self.body_node = body_node
         self.should_auto_return = should_auto_return
+        self.is_generator = is_generator
 
         if self.var_name_token:
             self.pos_start = self.var_name_token.pos_start
@@ -458,6 +514,13 @@ class ListNode:
         self.pos_end = pos_end
 
 
+class MapNode:
+    def __init__(self, pair_nodes, pos_start, pos_end) -> None:
+        self.pair_nodes = pair_nodes
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+
+
 class BinaryOperationNode:
     def __init__(self, left_node, op_token, right_node) -> None:
         self.left_node = left_node
@@ -498,6 +561,50 @@ class ReturnNode:
         self.node_to_return = node_to_return
         self.pos_start = pos_start
         self.pos_end = pos_end
+
+
+class YieldNode:
+    def __init__(self, node_to_yield, pos_start, pos_end):
+        self.node_to_yield = node_to_yield
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+
+
+class ImportNode:
+    def __init__(self, path_token, pos_start, pos_end):
+        self.path_token = path_token
+        self.pos_start = pos_start
+        self.pos_end = pos_end
+
+
+class MemberAccessNode:
+    def __init__(self, node, member_name_token):
+        self.node = node
+        self.member_name_token = member_name_token
+        self.pos_start = self.node.pos_start
+        self.pos_end = self.member_name_token.pos_end
+    
+
+# every node in the tree under node, including node itself
+def walk_nodes(node):
+    nodes = [node]
+
+    while nodes:
+        node = nodes.pop()
+        yield node
+        nodes.extend(child_nodes(list(vars(node).values())))
+
+def child_nodes(value):
+    if isinstance(value, (list, tuple)):
+        for item in value:
+            yield from child_nodes(item)
+    elif type(value).__name__.endswith("Node"):
+        yield value
+
+# names read in the tree under node. Any read counts, not only calls, since a function can be passed
+# to map or stored in another variable and called through it
+def used_names(node):
+    return {n.var_name_token.value for n in walk_nodes(node) if isinstance(n, VarAccessNode)}
     
 
 class ParseResult:
@@ -541,6 +648,8 @@ class Parser:
     def __init__(self, tokens) -> None:
         self.tokens = tokens
         self.token_index = -1
+        self.function_depth = 0
+        self.function_has_yield = False # a function whose body yields is a generator function
         self.advance()
 
     def update_current_token(self):
@@ -605,6 +714,52 @@ class Parser:
 
         return res.success(ListNode(element_nodes, pos_start, self.current_token.pos_end.copy()))
     
+    def map_expression(self):
+        res = ParseResult()
+        pair_nodes = []
+        pos_start = self.current_token.pos_start.copy()
+
+        if self.current_token.type != TT_LBRACE:
+            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '{'"))
+        
+        res.register_advance()
+        self.advance()
+
+        if self.current_token.type == TT_RBRACE:
+            res.register_advance()
+            self.advance()
+        else:
+            while True:
+                key = res.register(self.expression())
+                if res.error:
+                    return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '}', int, float, identifier, 'var', 'if', 'for', 'while', 'function', '+', '-', '(', '[', '{' or 'not'"))
+
+                if self.current_token.type != TT_COLON:
+                    return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected ':'"))
+
+                res.register_advance()
+                self.advance()
+
+                value = res.register(self.expression())
+                if res.error:
+                    return res
+
+                pair_nodes.append((key, value))
+
+                if self.current_token.type != TT_COMMA:
+                    break
+
+                res.register_advance()
+                self.advance()
+                
+            if self.current_token.type != TT_RBRACE:
+                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected ',' or '}'"))
+            
+            res.register_advance()
+            self.advance()
+
+        return res.success(MapNode(pair_nodes, pos_start, self.current_token.pos_end.copy()))
+    
     def if_expression(self):
         res = ParseResult()
         all_cases = res.register(self.if_expression_cases('if')) # cases we've had before
@@ -733,8 +888,11 @@ class Parser:
         res.register_advance()
         self.advance()
 
+        if self.current_token.matches(TT_KEYWORD, "in"):
+            return self.for_in_expression(var_name, res)
+
         if self.current_token.type != TT_EQUAL:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '='"))
+            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '=' or 'in'"))
         
         res.register_advance()
         self.advance()
@@ -792,6 +950,43 @@ class Parser:
         
         return res.success(ForNode(var_name, start_value, end_value, step_value, body, False))
 
+    # rest of `for x in expression then ...` once the variable name is parsed
+    def for_in_expression(self, var_name, res):
+        res.register_advance()
+        self.advance()
+
+        iterable = res.register(self.expression())
+        if res.error:
+            return res
+
+        if not self.current_token.matches(TT_KEYWORD, "then"):
+            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'then'"))
+        
+        res.register_advance()
+        self.advance()
+
+        if self.current_token.type == TT_NEWLINE:
+            res.register_advance()
+            self.advance()
+
+            body = res.register(self.statements())
+            if res.error:
+                return res
+
+            if not self.current_token.matches(TT_KEYWORD, 'end'):
+                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'end'"))
+
+            res.register_advance()
+            self.advance()
+
+            return res.success(ForInNode(var_name, iterable, body, True))
+
+        body = res.register(self.statement())
+        if res.error:
+            return res
+        
+        return res.success(ForInNode(var_name, iterable, body, False))
+
     def while_expression(self):
         res = ParseResult()
 
@@ -886,6 +1081,25 @@ class Parser:
         res.register_advance()
         self.advance()
 
+        outer_has_yield = self.function_has_yield
+        self.function_has_yield = False
+        self.function_depth += 1
+
+        body = res.register(self.function_body())
+
+        is_generator = self.function_has_yield
+        self.function_has_yield = outer_has_yield
+        self.function_depth -= 1
+
+        if res.error:
+            return res
+
+        body_node, should_auto_return = body
+        return res.success(FunctionNode(var_name_token, arg_name_tokens, body_node, should_auto_return, is_generator))
+
+    def function_body(self):
+        res = ParseResult()
+
         if self.current_token.type == TT_ARROW:
             res.register_advance()
             self.advance()
@@ -894,7 +1108,7 @@ class Parser:
             if res.error:
                 return res
             
-            return res.success(FunctionNode(var_name_token, arg_name_tokens, body, True))
+            return res.success((body, True))
         
         if self.current_token.type != TT_NEWLINE:
             return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected '->' or newline"))
@@ -912,13 +1126,24 @@ class Parser:
         res.register_advance()
         self.advance()
 
-        return res.success(FunctionNode(var_name_token, arg_name_tokens, body, False))
+        return res.success((body, False))
     
     def call(self):
         res = ParseResult()
         atom = res.register(self.atom())
         if res.error:
             return res
+
+        while self.current_token.type == TT_DOT:
+            res.register_advance()
+            self.advance()
+
+            if self.current_token.type != TT_IDENTIFIER:
+                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected identifier"))
+
+            atom = MemberAccessNode(atom, self.current_token)
+            res.register_advance()
+            self.advance()
         
         if self.current_token.type == TT_LPAREN:
             res.register_advance()
@@ -986,6 +1211,11 @@ class Parser:
             if res.error:
                 return res
             return res.success(list_expr)
+        elif token.type == TT_LBRACE:
+            map_expr = res.register(self.map_expression())
+            if res.error:
+                return res
+            return res.success(map_expr)
         elif token.matches(TT_KEYWORD, "if"):
             if_expression = res.register(self.if_expression())
             if res.error:
@@ -1006,8 +1236,29 @@ class Parser:
             if res.error:
                 return res
             return res.success(function_def)
+        elif token.matches(TT_KEYWORD, "import"):
+            import_expr = res.register(self.import_expression())
+            if res.error:
+                return res
+            return res.success(import_expr)
             
-        return res.failure(InvalidSyntaxError(token.pos_start, token.pos_end, "Expected int, float, identifier, '+', '-' or '(', '[' 'if', 'for', 'while', 'function'"))
+        return res.failure(InvalidSyntaxError(token.pos_start, token.pos_end, "Expected int, float, identifier, '+', '-' or '(', '[' 'if', 'for', 'while', 'function', 'import'"))
+
+    def import_expression(self):
+        res = ParseResult()
+        pos_start = self.current_token.pos_start.copy()
+
+        res.register_advance()
+        self.advance()
+
+        if self.current_token.type != TT_STRING:
+            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected string"))
+
+        path_token = self.current_token
+        res.register_advance()
+        self.advance()
+
+        return res.success(ImportNode(path_token, pos_start, path_token.pos_end))
     
     def factor(self):
         res = ParseResult()
@@ -1043,7 +1294,7 @@ class Parser:
                 return res
             return res.success(UnaryOperationNode(op_token, node))
 		
-        node = res.register(self.binary_op(self.arithmetic_expression, (TT_EE, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE)))
+        node = res.register(self.binary_op(self.arithmetic_expression, (TT_EE, TT_NE, TT_LT, TT_GT, TT_LTE, TT_GTE, (TT_KEYWORD, "in"))))
 		
         if res.error:
             return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected int, float, identifier, '+', '-', '(', '[' or 'Not'"))
@@ -1063,6 +1314,19 @@ class Parser:
                 self.reverse(res.to_reverse_count)
             return res.success(ReturnNode(expr, pos_start, self.current_token.pos_start.copy()))
         
+        if self.current_token.matches(TT_KEYWORD, 'yield'):
+            if self.function_depth == 0:
+                return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "'yield' outside of a function"))
+
+            self.function_has_yield = True
+            res.register_advance()
+            self.advance()
+
+            expr = res.try_register(self.expression())
+            if not expr:
+                self.reverse(res.to_reverse_count)
+            return res.success(YieldNode(expr, pos_start, self.current_token.pos_start.copy()))
+
         if self.current_token.matches(TT_KEYWORD, 'continue'):
             res.register_advance()
             self.advance()
@@ -1075,7 +1339,7 @@ class Parser:
 
         expr = res.register(self.expression())
         if res.error:
-            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'return', 'continue', 'break', 'var', 'if', 'for', 'while', 'function', 'not' int, float, identifier, '+', '-', '(' or '['"))
+            return res.failure(InvalidSyntaxError(self.current_token.pos_start, self.current_token.pos_end, "Expected 'return', 'yield', 'continue', 'break', 'var', 'if', 'for', 'while', 'function', 'not' int, float, identifier, '+', '-', '(' or '['"))
         
         return res.success(expr)
     
@@ -1230,11 +1494,12 @@ class Context:
         self.parent = parent
         self.parent_entry_pos = parent_entry_pos
         self.symbol_table = None
+        self.session = parent.session if parent else None # the Session the code runs in
 
 
 class SymbolTable:
-    def __init__(self, parent=None) -> None:
-        self.symbols = {}
+    def __init__(self, parent=None, symbols=None) -> None:
+        self.symbols = {} if symbols is None else symbols
         self.parent = parent
 
     def get(self, name):
@@ -1252,6 +1517,22 @@ class SymbolTable:
         del self.symbols[name]
 
 
+# table of the builtins, a BuiltinFunction is only made once its name is looked up so importing the
+# module doesn't build all of them
+class BuiltinSymbolTable(SymbolTable):
+    def __init__(self, builtin_names):
+        super().__init__()
+        self.builtin_names = builtin_names
+
+    def get(self, name):
+        value = self.symbols.get(name)
+
+        if value is None and name in self.builtin_names:
+            value = self.symbols[name] = BuiltinFunction(self.builtin_names[name])
+
+        return value
+
+
 class Value:
     def __init__(self):
         self.set_pos()
@@ -1266,6 +1547,12 @@ class Value:
         self.context = context
         return self
 
+    # values sent to other processes leave their context behind, it links the whole call stack
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["context"] = None
+        return state
+
     def add(self, other):
         return None, self.illegal_operation(other)
 
@@ -1281,7 +1568,7 @@ class Value:
     def pow(self, other):
         return None, self.illegal_operation(other)
 
-    def compare_eq(self, other):
+    def compare_ee(self, other):
         return None, self.illegal_operation(other)
 
     def compare_ne(self, other):
@@ -1308,12 +1595,24 @@ class Value:
     def notter(self):
         return None, self.illegal_operation()
 
+    # membership test for `other in self`
+    def contains(self, other):
+        return None, self.illegal_operation(other)
+
+    # python iterator over the values in this value, None if it isn't iterable
+    def iterate(self):
+        return None
+
     def execute(self, args):
         return RuntimeResult().failure(self.illegal_operation())
 
     def copy(self):
         raise Exception("No copy method defined")
 
+    # python value used to hash this value as a map key, None if it can't be a key
+    def hash_key(self):
+        return None
+
     def is_true(self):
         return False
 
@@ -1430,6 +1729,9 @@ class Number(Value):
     
     def is_true(self):
         return self.value != 0
+
+    def hash_key(self):
+        return self.value
         
     def __repr__(self) -> str:
         return str(self.value)
@@ -1441,14 +1743,68 @@ Number.false = Number(0)
 Number.math_PI = Number(math.pi)
 
 
+# shared piece list of ropes. It keeps its longest join, so every string made of that many pieces reads
+# it without joining again, and longer strings only join the pieces after it
+class Pieces(list):
+    flat = ""
+    flat_count = 0
+
+    def join(self, count):
+        if count != self.flat_count:
+            if count > self.flat_count:
+                self.flat = "".join([self.flat, *self[self.flat_count:count]])
+                self.flat_count = count
+            else:
+                return "".join(self[:count]) # a shorter string sharing the list, rarely read after it grew
+
+        return self.flat
+
+
 class String(Value):
-    def __init__(self, value):
+    def __init__(self, value, pieces=None):
         super().__init__()
-        self.value = value
+
+        # a string is either flat (a plain python str) or a rope: a prefix of a shared
+        # list of pieces that only gets joined when the value is observed
+        if pieces is None:
+            self.flat = value
+            self.pieces = None
+            self.piece_count = 0
+            self.length = len(value)
+        else:
+            self.flat = None
+            self.pieces = pieces
+            self.piece_count = len(pieces)
+            self.length = value
+
+    @property
+    def value(self):
+        if self.flat is None:
+            self.flat = self.pieces.join(self.piece_count)
+        return self.flat
+
+    # only this string's part of the shared pieces is sent
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.update(flat=self.value, pieces=None, piece_count=0)
+        return state
+
+    def concat(self, other):
+        pieces = self.pieces
+
+        # only the string owning the tip of the shared piece list can append to it in place,
+        # any other string sharing the list starts a new one from its own prefix
+        if pieces is None:
+            pieces = Pieces([self.flat])
+        elif len(pieces) != self.piece_count:
+            pieces = Pieces(pieces[:self.piece_count])
+
+        pieces.append(other.value)
+        return String(self.length + other.length, pieces)
     
     def add(self, other):
         if isinstance(other, String):
-            return String(self.value + other.value).set_context(self.context), None
+            return self.concat(other).set_context(self.context), None
         else:
             return None, Value.illegal_operation(self, other)
 
@@ -1458,11 +1814,64 @@ class String(Value):
         else:
             return None, Value.illegal_operation(self, other)
 
+    def compare_ee(self, other):
+        if isinstance(other, String):
+            return Number(int(self.length == other.length and self.value == other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_ne(self, other):
+        if isinstance(other, String):
+            return Number(int(self.length != other.length or self.value != other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_lt(self, other):
+        if isinstance(other, String):
+            return Number(int(self.value < other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_gt(self, other):
+        if isinstance(other, String):
+            return Number(int(self.value > other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_lte(self, other):
+        if isinstance(other, String):
+            return Number(int(self.value <= other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_gte(self, other):
+        if isinstance(other, String):
+            return Number(int(self.value >= other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def contains(self, other):
+        if isinstance(other, String):
+            return Number(int(other.value in self.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def iterate(self):
+        return map(String, self.value)
+
     def is_true(self):
-        return len(self.value) > 0
+        return self.length > 0
+
+    # python caches the hash of a str, so the flattened value doubles as a cached hash
+    def hash_key(self):
+        return self.value
 
     def copy(self):
-        copy = String(self.value)
+        copy = String.__new__(String)
+        copy.flat = self.flat
+        copy.pieces = self.pieces
+        copy.piece_count = self.piece_count
+        copy.length = self.length
         copy.set_pos(self.pos_start, self.pos_end)
         copy.set_context(self.context)
 
@@ -1475,108 +1884,396 @@ class String(Value):
         return f'"{self.value}"'
     
 
-class BaseFunction(Value):
-    def __init__(self, name):
+class Bytes(Value):
+    mapped = weakref.WeakSet() # bytes sharing an mmap buffer, they get a copy of their range when its file is closed
+
+    def __init__(self, buffer, start=0, end=None):
         super().__init__()
-        self.name = name or "<anon>"
 
-    def generate_new_context(self):
-        new_context = Context(self.name, self.context, self.pos_start)
-        new_context.symbol_table = SymbolTable(new_context.parent.symbol_table)
+        # a range of a bytes, bytearray or mmap buffer, slices share the buffer instead of copying it
+        self.buffer = buffer
+        self.start = start
+        self.end = len(buffer) if end is None else end
 
-        return new_context
-    
-    def check_args(self, arg_names, args):
-        res = RuntimeResult()
+        if isinstance(buffer, mmap.mmap):
+            Bytes.mapped.add(self)
 
-        if len(args) > len(arg_names):
-            return res.failure(RuntimeError(self.pos_start, self.pos_end, f"{len(args)} - {len(arg_names)} too many args passed into {self}", self.context))
-        
-        if len(args) < len(arg_names):
-            return res.failure(RuntimeError(self.pos_start, self.pos_end, f"{len(arg_names) - len(args)} too few args passed into {self}", self.context))
-        
-        return res.success(None)
-    
-    def populate_args(self, arg_names, args, exec_context):
-        for i in range(len(args)):
-            arg_name = arg_names[i]
-            arg_value = args[i]
-            arg_value.set_context(exec_context)
-            exec_context.symbol_table.set(arg_name, arg_value)
+    # copy of the range as python bytes
+    @property
+    def value(self):
+        return self.buffer[self.start:self.end]
 
-    def check_and_populate_args(self, arg_names, args, exec_context):
-        res = RuntimeResult()
+    def view(self):
+        return memoryview(self.buffer)[self.start:self.end]
 
-        res.register(self.check_args(arg_names, args))
-        if res.should_return():
-            return res
-        
-        self.populate_args(arg_names, args, exec_context)
+    def length(self):
+        return self.end - self.start
 
-        return res.success(None)
-    
+    # moves the range into a buffer of its own
+    def detach(self):
+        self.buffer = self.value
+        self.start, self.end = 0, len(self.buffer)
+        Bytes.mapped.discard(self)
 
-class Function(BaseFunction):
-    def __init__(self, name, body_node, arg_names, should_auto_return):
-        super().__init__(name)
-        self.body_node = body_node
-        self.arg_names = arg_names
-        self.should_auto_return = should_auto_return
+    # python style slice of the range, negative indexes count from the end
+    def slice(self, start, end):
+        indexes = range(self.start, self.end)[start:end]
+        return Bytes(self.buffer, indexes.start, max(indexes.start, indexes.stop))
 
-    def execute(self, args):
-        res = RuntimeResult()
-        interpreter = Interpreter()
-        exec_context = self.generate_new_context()
+    # index of sub in the range after start, or -1. A negative start counts from the end
+    def find(self, sub, start=0):
+        if start < 0:
+            start = max(start + self.length(), 0)
 
-        res.register(self.check_and_populate_args(self.arg_names, args, exec_context))
-        if res.should_return():
-            return res
+        index = self.buffer.find(sub, self.start + start, self.end)
+        return index if index == -1 else index - self.start
 
-        value = res.register(interpreter.visit(self.body_node, exec_context))
-        if res.should_return() and res.function_return_value == None:
-            return res
-        
-        return_value = (value if self.should_auto_return else None) or res.function_return_value or Number.null
-        
-        return res.success(return_value)
+    def split(self, separator):
+        parts = []
+        start = self.start
 
-    def copy(self):
-        copy = Function(self.name, self.body_node, self.arg_names, self.should_auto_return)
-        copy.set_context(self.context)
-        copy.set_pos(self.pos_start, self.pos_end)
+        while True:
+            index = self.buffer.find(separator, start, self.end)
+            if index == -1:
+                break
+            parts.append(Bytes(self.buffer, start, index))
+            start = index + len(separator)
 
-        return copy
+        parts.append(Bytes(self.buffer, start, self.end))
+        return parts
 
-    def __repr__(self):
-        return f"<function {self.name}>"
-    
+    def add(self, other):
+        if isinstance(other, Bytes):
+            return Bytes(self.value + other.value).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
 
-class BuiltinFunction(BaseFunction):
-    def __init__(self, name):
-        super().__init__(name)
-        
-    def execute(self, args):
-        res = RuntimeResult()
-        exec_context = self.generate_new_context()
+    # get byte from the range
+    def div(self, other):
+        if isinstance(other, Number) and 0 <= other.value < self.length():
+            return Number(self.buffer[self.start + int(other.value)]).set_context(self.context), None
+        elif isinstance(other, Number):
+            return None, RuntimeError(other.pos_start, other.pos_end, 'Byte at this index could not be retrieved as index is out of bounds', self.context)
+        else:
+            return None, Value.illegal_operation(self, other)
 
-        method_name = f'execute_{self.name}'
-        method = getattr(self, method_name, self.no_visit_method)
+    def compare_ee(self, other):
+        if isinstance(other, Bytes):
+            return Number(int(self.view() == other.view())).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
 
-        res.register(self.check_and_populate_args(method.arg_names, args, exec_context))
-        if res.should_return():
+    def compare_ne(self, other):
+        if isinstance(other, Bytes):
+            return Number(int(self.view() != other.view())).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_lt(self, other):
+        if isinstance(other, Bytes):
+            return Number(int(self.value < other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_gt(self, other):
+        if isinstance(other, Bytes):
+            return Number(int(self.value > other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_lte(self, other):
+        if isinstance(other, Bytes):
+            return Number(int(self.value <= other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def compare_gte(self, other):
+        if isinstance(other, Bytes):
+            return Number(int(self.value >= other.value)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def contains(self, other):
+        if isinstance(other, Bytes):
+            return Number(int(self.find(other.value) != -1)).set_context(self.context), None
+        elif isinstance(other, String): # encoded as utf-8, like find does
+            return Number(int(self.find(other.value.encode()) != -1)).set_context(self.context), None
+        elif isinstance(other, Number) and 0 <= other.value < 256:
+            return Number(int(self.find(bytes([int(other.value)])) != -1)).set_context(self.context), None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    def iterate(self):
+        return map(Number, self.view())
+
+    def is_true(self):
+        return self.end > self.start
+
+    def hash_key(self):
+        return bytes(self.view())
+
+    # only the range is sent, not the whole buffer (which can't be pickled for mmaps)
+    def __getstate__(self):
+        state = super().__getstate__()
+        state.update(buffer=self.value, start=0, end=self.length())
+        return state
+
+    def copy(self):
+        copy = Bytes(self.buffer, self.start, self.end)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+
+        return copy
+
+    def __repr__(self):
+        return repr(self.value)
+    
+
+class BaseFunction(Value):
+    def __init__(self, name):
+        super().__init__()
+        self.name = name or "<anon>"
+
+    # the last optional_count args may be left out
+    def check_args(self, arg_names, args, optional_count=0):
+        res = RuntimeResult()
+
+        if len(args) > len(arg_names):
+            return res.failure(RuntimeError(self.pos_start, self.pos_end, f"{len(args)} - {len(arg_names)} too many args passed into {self}", self.context))
+        
+        if len(args) < len(arg_names) - optional_count:
+            return res.failure(RuntimeError(self.pos_start, self.pos_end, f"{len(arg_names) - optional_count - len(args)} too few args passed into {self}", self.context))
+        
+        return res.success(None)
+    
+
+class Function(BaseFunction):
+    def __init__(self, name, body_node, arg_names, should_auto_return, is_generator=False):
+        super().__init__(name)
+        self.body_node = body_node
+        self.arg_names = arg_names
+        self.should_auto_return = should_auto_return
+        self.is_generator = is_generator
+
+    def execute(self, args):
+        arg_names = self.arg_names
+
+        # single arity check, then the args become the frame's symbols directly
+        if len(args) != len(arg_names):
+            return self.check_args(arg_names, args)
+
+        exec_context = Context(self.name, self.context, self.pos_start)
+        exec_context.symbol_table = SymbolTable(self.context.symbol_table, dict(zip(arg_names, args)))
+
+        if self.is_generator:
+            return RuntimeResult().success(Iterator(self.generate(exec_context)))
+
+        res = Interpreter.shared.visit(self.body_node, exec_context)
+        if res.function_return_value is None and res.should_return():
+            return res
+        
+        return res.success((res.value if self.should_auto_return else None) or res.function_return_value or Number.null)
+
+    # execute for an AsyncInterpreter, the body is resumed so the script can be suspended inside it
+    def resume(self, args, interpreter):
+        arg_names = self.arg_names
+
+        if len(args) != len(arg_names):
+            return self.check_args(arg_names, args)
+
+        exec_context = Context(self.name, self.context, self.pos_start)
+        exec_context.symbol_table = SymbolTable(self.context.symbol_table, dict(zip(arg_names, args)))
+
+        res = yield from interpreter.resume(self.body_node, exec_context)
+        if res.function_return_value is None and res.should_return():
             return res
 
-        return_value = res.register(method(exec_context))
+        return res.success((res.value if self.should_auto_return else None) or res.function_return_value or Number.null)
+
+    # runs the body one yield statement at a time
+    def generate(self, exec_context):
+        res = yield from GeneratorInterpreter().resume(self.body_node, exec_context)
+        if res.error:
+            raise IterationError(res.error)
+
+    def copy(self):
+        copy = Function(self.name, self.body_node, self.arg_names, self.should_auto_return, self.is_generator)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+
+        return copy
+
+    def __repr__(self):
+        return f"<function {self.name}>"
+    
+
+class LRUCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # cached value or None
+    def get(self, key):
+        value = self.entries.get(key)
+
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.entries.move_to_end(key)
+
+        return value
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+
+# builtins that have side effects, functions calling them can't be memoized
+IMPURE_BUILTINS = {"print", "input", "input_int", "clear", "cls", "append", "pop", "extend", "put", "remove", "next", "run", "sleep", "read_file", "read_lines", "write_file", "spawn", "send", "recv", "wait", "open", "read_chunk", "write", "writeln", "flush", "close"}
+
+# builtins that need the script to run on an event loop to work fully
+TASK_BUILTINS = {"spawn", "wait", "send", "recv"}
+
+# turns of the event loop with every script blocked and none going on before it counts as a deadlock,
+# a woken up script can take a few turns to run again
+DEADLOCK_ROUNDS = 3
+
+
+class MemoFunction(BaseFunction):
+    def __init__(self, function, cache):
+        super().__init__(function.name)
+        self.function = function
+        self.cache = cache
+
+    def execute(self, args):
+        cache_key = tuple([arg.hash_key() for arg in args])
+
+        # lists, maps and functions can't be keys so those calls aren't cached
+        if None in cache_key:
+            return self.function.execute(args)
+
+        value = self.cache.get(cache_key)
+        if value is not None:
+            return RuntimeResult().success(value)
+
+        res = self.function.execute(args)
         if res.should_return():
             return res
+
+        # results that can be changed, like lists, would be shared by every later call
+        if isinstance(res.value, (Number, String, Bytes)):
+            self.cache.put(cache_key, res.value)
+
+        return res
+
+    def copy(self):
+        copy = MemoFunction(self.function, self.cache)
+        copy.set_context(self.context)
+        copy.set_pos(self.pos_start, self.pos_end)
+
+        return copy
+
+    def __repr__(self):
+        return f"<memoized function {self.name}>"
+
+
+# worker processes for pmap, started on first use and kept warm for later calls
+pmap_pool = None
+
+def get_pmap_pool():
+    global pmap_pool
+
+    if pmap_pool is None:
+        pmap_pool = process_pool.ProcessPoolExecutor()
+
+    return pmap_pool
+
+# values of the non builtin names a function refers to, so it can run without its context. They're
+# looked up in the function's own context, the way calling it would, the caller's is used for values
+# without one
+def closure_snapshot(function, context):
+    symbol_table = (function.context or context).symbol_table
+    closure = {}
+    functions = [function]
+
+    while functions:
+        function = functions.pop()
+        if isinstance(function, MemoFunction):
+            function = function.function
+        if not isinstance(function, Function):
+            continue
+
+        for node in walk_nodes(function.body_node):
+            if not isinstance(node, VarAccessNode) or node.var_name_token.value in closure:
+                continue
+
+            name = node.var_name_token.value
+            value = symbol_table.get(name)
+
+            if value is not None and value is not global_symbol_table.get(name):
+                closure[name] = value
+                functions.append(value)
+
+    return closure
+
+# runs in a worker process, returns the results or the error's traceback text
+def pmap_chunk(function, closure, elements):
+    # a forked worker inherits the parent's unflushed output, which the parent writes itself
+    default_session.output = BufferedOutput()
+
+    context = Context("<pmap>")
+    context.session = default_session
+    context.symbol_table = SymbolTable(global_symbol_table, closure)
+
+    for value in [function, *closure.values()]:
+        value.set_context(context)
+        if isinstance(value, MemoFunction):
+            value.function.set_context(context)
+
+    results = []
+    for element in elements:
+        res = function.execute([element])
+        if res.error:
+            default_session.output.flush()
+            return None, res.error.as_string()
+        results.append(res.value)
+
+    default_session.output.flush()
+    return results, None
+
+
+class BuiltinFunction(BaseFunction):
+    def __init__(self, name, spec=None):
+        super().__init__(name)
+
+        if spec is None:
+            spec = BuiltinFunction.registry.get(name)
+            if spec is None:
+                raise Exception(f'No execute_{name} method defined')
+
+        # python function taking the arg values directly, and the arg counts it accepts
+        self.spec = spec
+        self.function, self.min_args, self.max_args, self.arg_names = spec
+
+        # coroutine version used by AsyncInterpreter, only for the builtins defined here
+        self.async_function = BuiltinFunction.async_registry.get(name) if spec is BuiltinFunction.registry.get(name) else None
         
-        return res.success(return_value)
-    
-    def no_visit_method(self, node, context):
-        raise Exception(f'No execute_{self.name} method defined')
+    def execute(self, args):
+        if not self.min_args <= len(args) <= self.max_args:
+            return self.check_args(self.arg_names, args, self.max_args - self.min_args)
+
+        return self.function(self, *args)
     
     def copy(self):
-        copy = BuiltinFunction(self.name)
+        copy = BuiltinFunction(self.name, self.spec)
         copy.set_context(self.context)
         copy.set_pos(self.pos_start, self.pos_end)
 
@@ -1586,502 +2283,2807 @@ class BuiltinFunction(BaseFunction):
         return f"<built-in function {self.name}>"
     
 
+    # elements of any iterable value, lists are returned without copying
+    def collect(self, value, message):
+        if isinstance(value, List):
+            return value.elements, None
+
+        iterator = value.iterate()
+        if iterator is None:
+            return None, RuntimeError(self.pos_start, self.pos_end, message, self.context)
+
+        try:
+            return list(iterator), None
+        except IterationError as ex:
+            return None, ex.error
+
     # Built-in functions code
-    def execute_print(self, exec_context):
-        print(str(exec_context.symbol_table.get('value')))
+    def execute_print(self, value):
+        self.context.session.output.write(str(value) + "\n")
         return RuntimeResult().success(Number.null)
-    execute_print.arg_names = ['value']
 
-    def execute_print_ret(self, exec_context):
-        return RuntimeResult().success(String(str(exec_context.symbol_table.get('value'))))
-    execute_print_ret.arg_names = ['value']
+    def execute_print_ret(self, value):
+        return RuntimeResult().success(String(str(value)))
     
-    def execute_input(self, exec_context):
+    def execute_input(self):
+        self.context.session.output.flush() # so a prompt printed before is visible
         text = input()
         return RuntimeResult().success(String(text))
-    execute_input.arg_names = []
 
-    def execute_input_int(self, exec_context):
+    def execute_input_int(self):
+        output = self.context.session.output
+
         while True:
+            output.flush()
             text = input()
             try:
                 number = int(text)
                 break
             except ValueError:
-                print(f"'{text}' must be an integer.")
+                output.write(f"'{text}' must be an integer.\n")
         return RuntimeResult().success(Number(number))
-    execute_input_int.arg_names = []
 
-    def execute_clear(self, exec_context):
+    def execute_clear(self):
+        self.context.session.output.flush()
         os.system('cls' if os.name == 'nt' else 'clear')  # cls for window, clear for unix
         return RuntimeResult().success(Number.null)
-    execute_clear.arg_names = []
 
-    def execute_is_number(self, exec_context):
-        is_number = isinstance(exec_context.symbol_table.get("value"), Number)
+    def execute_is_number(self, value):
+        is_number = isinstance(value, Number)
         return RuntimeResult().success(Number.true if is_number else Number.false)
-    execute_is_number.arg_names = ["value"]
 
-    def execute_is_string(self, exec_context):
-        is_string = isinstance(exec_context.symbol_table.get("value"), String)
+    def execute_is_string(self, value):
+        is_string = isinstance(value, String)
         return RuntimeResult().success(Number.true if is_string else Number.false)
-    execute_is_string.arg_names = ["value"]
 
-    def execute_is_list(self, exec_context):
-        is_list = isinstance(exec_context.symbol_table.get("value"), List)
+    def execute_is_list(self, value):
+        is_list = isinstance(value, List)
         return RuntimeResult().success(Number.true if is_list else Number.false)
-    execute_is_list.arg_names = ["value"]
 
-    def execute_is_function(self, exec_context):
-        is_function = isinstance(exec_context.symbol_table.get("value"), BaseFunction)
+    def execute_is_function(self, value):
+        is_function = isinstance(value, BaseFunction)
         return RuntimeResult().success(Number.true if is_function else Number.false)
-    execute_is_function.arg_names = ["value"]
 
-    def execute_append(self, exec_context):
-        list_ = exec_context.symbol_table.get("list")
-        value = exec_context.symbol_table.get("value")
+    def execute_append(self, list_, value):
+        if isinstance(list_, Set):
+            hash_key = value.hash_key()
+            if hash_key is None:
+                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Set members must be numbers or strings", self.context))
+
+            list_.members.setdefault(hash_key, value)
+            return RuntimeResult().success(Number.null)
 
         if not isinstance(list_, List):
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a list", exec_context))
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a list or a set", self.context))
 
         list_.elements.append(value)
         return RuntimeResult().success(Number.null)
-    execute_append.arg_names = ["list", "value"]
-
-    def execute_pop(self, exec_context):
-        list_ = exec_context.symbol_table.get("list")
-        index = exec_context.symbol_table.get("index")
 
+    def execute_pop(self, list_, index):
         if not isinstance(list_, List):
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a list", exec_context))
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a list", self.context))
         
         if not isinstance(index, Number):
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a number", exec_context))
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a number", self.context))
         
         try:
             element = list_.elements.pop(index.value)
         except:
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, 'Element at this index could not be removed from list because index is out of bounds', exec_context))
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, 'Element at this index could not be removed from list because index is out of bounds', self.context))
         
         return RuntimeResult().success(element)
-    execute_pop.arg_names = ["list", "index"]
-
-    def execute_extend(self, exec_context):
-        listA = exec_context.symbol_table.get("listA")
-        listB = exec_context.symbol_table.get("listB")
 
+    def execute_extend(self, listA, listB):
         if not isinstance(listA, List):
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a list", exec_context))
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a list", self.context))
 
         if not isinstance(listB, List):
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a list", exec_context))
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a list", self.context))
 
         listA.elements.extend(listB.elements)
         return RuntimeResult().success(Number.null)
-    execute_extend.arg_names = ["listA", "listB"]
 
-    def execute_len(self, exec_context):
-        list_ = exec_context.symbol_table.get("list")
+    def execute_len(self, list_):
+        if isinstance(list_, String):
+            return RuntimeResult().success(Number(list_.length))
+
+        if isinstance(list_, Map):
+            return RuntimeResult().success(Number(len(list_.entries)))
+
+        if isinstance(list_, Set):
+            return RuntimeResult().success(Number(len(list_.members)))
+
+        if isinstance(list_, Bytes):
+            return RuntimeResult().success(Number(list_.length()))
 
         if not isinstance(list_, List):
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a list", exec_context))
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a list, a string, bytes, a map or a set", self.context))
 
         return RuntimeResult().success(Number(len(list_.elements)))
-    execute_len.arg_names = ["list"]
 
-    def execute_run(self, exec_context):
-        filename = exec_context.symbol_table.get("filename")
+    def execute_join(self, list_, separator):
+        elements, error = self.collect(list_, "1st argument must be iterable")
+        if error:
+            return RuntimeResult().failure(error)
 
-        if not isinstance(filename, String):
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a string", exec_context))
-        
-        filename = filename.value
-        
-        try:
-            name, ext = os.path.splitext(filename)
-            if ext != ".ar":
-                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Invalid file extension\n", exec_context))
+        if not isinstance(separator, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a string", self.context))
 
-            with open(filename, "r") as f:
-                script = f.read()
-        except Exception as ex:
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to load script \"{filename}\"\n" + str(ex), exec_context))
-        
-        _, error = run(script, filename)
+        return RuntimeResult().success(String(separator.value.join([str(x) for x in elements])))
 
-        if error:
-            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to finish executing script \"{filename}\"\n" + error.as_string(), exec_context))
+    def execute_split(self, string_, separator):
+        if isinstance(string_, Bytes):
+            separator = self.bytes_arg(separator)
+            if not separator:
+                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be non-empty bytes or string", self.context))
+            return RuntimeResult().success(List(string_.split(separator)))
 
-        return RuntimeResult().success(Number.null)
-    execute_run.arg_names = ["filename"]
-
-
-BuiltinFunction.print = BuiltinFunction("print")
-BuiltinFunction.print_ret = BuiltinFunction("print_ret")
-BuiltinFunction.input = BuiltinFunction("input")
-BuiltinFunction.input_int = BuiltinFunction("input_int")
-BuiltinFunction.clear = BuiltinFunction("clear")
-BuiltinFunction.is_number = BuiltinFunction("is_number")
-BuiltinFunction.is_string = BuiltinFunction("is_string")
-BuiltinFunction.is_list = BuiltinFunction("is_list")
-BuiltinFunction.is_function  = BuiltinFunction("is_function")
-BuiltinFunction.append = BuiltinFunction("append")
-BuiltinFunction.pop = BuiltinFunction("pop")
-BuiltinFunction.extend = BuiltinFunction("extend")
-BuiltinFunction.len = BuiltinFunction("len")
-BuiltinFunction.run = BuiltinFunction("run")
+        if not isinstance(string_, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a string", self.context))
 
-class List(Value):
-    def __init__(self, elements):
-        super().__init__()
-        self.elements = elements
+        if not isinstance(separator, String) or separator.length == 0:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a non-empty string", self.context))
 
-    # append elements to list
-    def add(self, other):
-        new_list = self.copy()
-        new_list.elements.append(other)
+        return RuntimeResult().success(List([String(x) for x in string_.value.split(separator.value)]))
 
-        return new_list, None
+    def execute_substring(self, string_, start, end):
+        if not isinstance(string_, (String, Bytes)):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a string or bytes", self.context))
 
-    # remove element from list
-    def sub(self, other):
-        if isinstance(other, Number):
-            new_list = self.copy()
-            try:
-                new_list.elements.pop(other.value)
+        if not isinstance(start, Number) or not isinstance(end, Number):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd and 3rd arguments must be numbers", self.context))
 
-                return new_list, None
-            except:
-                return None, RuntimeError(other.pos_start, other.pos_end, 'Element at this index could not be removed from list as index is out of bounds', self.context)
-        else:
-            return None, Value.illegal_operation(self, other)
+        # bytes are sliced without copying
+        if isinstance(string_, Bytes):
+            return RuntimeResult().success(string_.slice(int(start.value), int(end.value)))
 
-    # concatenate to list to list
-    def mul(self, other):
-        if isinstance(other, List):
-            new_list = self.copy()
-            new_list.elements.extend(other.elements)
+        return RuntimeResult().success(String(string_.value[int(start.value):int(end.value)]))
 
-            return new_list, None
-        else:
-            return None, Value.illegal_operation(self, other)
+    # python bytes of a bytes or string (encoded as utf-8) value, None for other values
+    def bytes_arg(self, value):
+        if isinstance(value, Bytes):
+            return value.value
+        if isinstance(value, String):
+            return value.value.encode()
+        return None
 
-    # get element from list
-    def div(self, other):
-        if isinstance(other, Number):
-            try:
-                return self.elements[other.value], None
-            except:
-                return None, RuntimeError(other.pos_start, other.pos_end, 'Element at this index could not be retrieved from list as index is out of bounds', self.context)
+    def execute_find(self, string_, sub, start=None):
+        if start is None:
+            start = 0
+        elif isinstance(start, Number):
+            start = int(start.value)
         else:
-            return None, Value.illegal_operation(self, other)
-  
-    def copy(self):
-        copy = List(self.elements)
-        copy.set_pos(self.pos_start, self.pos_end)
-        copy.set_context(self.context)
-        
-        return copy
-    
-    def __str__(self) -> str:
-        return ", ".join([str(x) for x in self.elements])
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "3rd argument must be a number", self.context))
 
-    def __repr__(self):
-        return f'[{", ".join([str(x) for x in self.elements])}]'
-    
+        if isinstance(string_, Bytes):
+            sub = self.bytes_arg(sub)
+            if sub is None:
+                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be bytes or a string", self.context))
+            return RuntimeResult().success(Number(string_.find(sub, start)))
 
-class Interpreter:
-    def visit(self, node, context):
-        method_name = f"visit_{type(node).__name__}"
-        method = getattr(self, method_name, self.no_visit_method)
-        return method(node, context)
-    
-    def no_visit_method(self, node, context):
-        raise Exception(f"No visit_{type(node).__name__} method defined")
-    
-    def visit_NumberNode(self, node, context):
-        return RuntimeResult().success(Number(node.token.value).set_context(context).set_pos(node.pos_start, node.pos_end))
-    
-    def visit_StringNode(self, node, context):
-        return RuntimeResult().success(String(node.token.value).set_context(context).set_pos(node.pos_start, node.pos_end))
-    
-    def visit_ListNode(self, node, context):
-        res = RuntimeResult()
-        elements = []
+        if not isinstance(string_, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a string or bytes", self.context))
 
-        for element_node in node.element_nodes:
-            elements.append(res.register(self.visit(element_node, context)))
+        if not isinstance(sub, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a string", self.context))
+
+        return RuntimeResult().success(Number(string_.value.find(sub.value, start)))
+
+    def execute_to_bytes(self, value, encoding=None):
+        if isinstance(value, Bytes):
+            return RuntimeResult().success(value)
 
+        # the whole mapping, without reading it
+        if isinstance(value, File) and value.mode == "m":
+            res = self.check_file(value, "m")
             if res.should_return():
                 return res
-            
-        return res.success(List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
-    
-    def visit_VarAccessNode(self, node, context):
-        res = RuntimeResult()
-        var_name = node.var_name_token.value
-        value = context.symbol_table.get(var_name)
 
-        if not value:
-            return res.failure(RuntimeError(node.pos_start, node.pos_end, f"'{var_name}' is not defined", context))
-        
-        value = value.copy().set_context(context).set_pos(node.pos_start, node.pos_end)
-        return res.success(value)
-    
-    def visit_VarAssignNode(self, node, context):
-        res = RuntimeResult()
-        var_name = node.var_name_token.value
-        value = res.register(self.visit(node.value_node, context))
+            return res.success(Bytes(value.stream))
 
-        if res.should_return():
-            return res
-        
-        context.symbol_table.set(var_name, value)
-        return res.success(value)
+        if isinstance(value, List):
+            try:
+                return RuntimeResult().success(Bytes(bytes([int(x.value) for x in value.elements])))
+            except (AttributeError, TypeError, ValueError):
+                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "List elements must be numbers from 0 to 255", self.context))
 
-    def visit_BinaryOperationNode(self, node, context):
-        res = RuntimeResult()
-        left = res.register(self.visit(node.left_node, context))
-        if res.should_return(): return res
-        right = res.register(self.visit(node.right_node, context))
-        if res.should_return(): return res
+        if not isinstance(value, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a string, a list of numbers or a mapped file", self.context))
 
-        if node.op_token.type == TT_PLUS:
-            result, error = left.add(right)
-        elif node.op_token.type == TT_MINUS:
-            result, error = left.sub(right)
-        elif node.op_token.type == TT_MUL:
-            result, error = left.mul(right)
-        elif node.op_token.type == TT_DIV:
-            result, error = left.div(right)
-        elif node.op_token.type == TT_POW:
-            result, error = left.pow(right)
-        elif node.op_token.type == TT_EE:
-            result, error = left.compare_ee(right)
-        elif node.op_token.type == TT_NE:
-            result, error = left.compare_ne(right)
-        elif node.op_token.type == TT_LT:
-            result, error = left.compare_lt(right)
-        elif node.op_token.type == TT_GT:
-            result, error = left.compare_gt(right)
-        elif node.op_token.type == TT_LTE:
-            result, error = left.compare_lte(right)
-        elif node.op_token.type == TT_GTE:
-            result, error = left.compare_gte(right)
-        elif node.op_token.matches(TT_KEYWORD, "and"):
-            result, error = left.ander(right)
-        elif node.op_token.matches(TT_KEYWORD, "or"):
-            result, error = left.orer(right)
+        if encoding is not None and not isinstance(encoding, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a string", self.context))
+
+        try:
+            return RuntimeResult().success(Bytes(value.value.encode(encoding.value if encoding else "utf-8")))
+        except (LookupError, UnicodeError) as ex:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to encode string: {ex}", self.context))
+
+    def execute_decode(self, bytes_, encoding=None):
+        if not isinstance(bytes_, Bytes):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be bytes", self.context))
+
+        if encoding is not None and not isinstance(encoding, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a string", self.context))
+
+        try:
+            return RuntimeResult().success(String(str(bytes_.view(), encoding.value if encoding else "utf-8")))
+        except (LookupError, UnicodeError) as ex:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to decode bytes: {ex}", self.context))
+
+    # integer written in a string or bytes, only the parsed range is copied for bytes
+    def execute_parse_int(self, value, base=None):
+        if not isinstance(value, (String, Bytes)):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a string or bytes", self.context))
+
+        if base is None:
+            base = 10
+        elif isinstance(base, Number) and (base.value == 0 or 2 <= base.value <= 36):
+            base = int(base.value)
+        else:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be 0 or a number from 2 to 36", self.context))
+
+        try:
+            return RuntimeResult().success(Number(int(value.value, base)))
+        except ValueError:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Can't parse {value!r} as an integer", self.context))
 
+    # whether the fields of a format template only pick args by position, attribute and index lookups
+    # like {0.__class__} would let scripts reach into python objects
+    def positional_fields(self, template):
+        for _, field_name, format_spec, _ in Formatter().parse(template):
+            if field_name and not (field_name.isascii() and field_name.isdigit()):
+                return False
+            if format_spec and not self.positional_fields(format_spec):
+                return False
 
+        return True
+
+    def execute_format(self, template, values):
+        if not isinstance(template, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a string", self.context))
+
+        if not isinstance(values, List):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a list", self.context))
+
+        # numbers and strings are passed through so format specs like {:.2f} work
+        args = [x.value if isinstance(x, (Number, String)) else str(x) for x in values.elements]
+
+        try:
+            if not self.positional_fields(template.value):
+                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Format fields can only be positions, like {} or {0}", self.context))
+
+            text = template.value.format(*args)
+        except (IndexError, KeyError, ValueError) as ex:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to format string: {ex}", self.context))
+
+        return RuntimeResult().success(String(text))
+
+    def execute_get(self, map_, key):
+        if not isinstance(map_, Map):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a map", self.context))
+
+        value, error = map_.div(key)
         if error:
-            return res.failure(error)
+            return RuntimeResult().failure(error)
 
-        return res.success(result.set_pos(node.pos_start, node.pos_end))
-    
-    def visit_UnaryOperationNode(self, node, context):
-        res = RuntimeResult()
-        number = res.register(self.visit(node.node, context))
-        if res.should_return():
-            return res
+        return RuntimeResult().success(value)
 
-        if node.op_token.type == TT_MINUS:
-            number, error = number.mul(Number(-1))
-        elif node.op_token.matches(TT_KEYWORD, "not"):
-            number, error = number.notter()
+    def execute_put(self, map_, key, value):
+        if not isinstance(map_, Map):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a map", self.context))
+
+        hash_key = key.hash_key()
+        if hash_key is None:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a number or a string", self.context))
+
+        map_.entries[hash_key] = (key, value)
+        return RuntimeResult().success(Number.null)
+
+    def execute_has(self, map_, key):
+        if not isinstance(map_, Map):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a map", self.context))
+
+        hash_key = key.hash_key()
+        return RuntimeResult().success(Number.true if hash_key is not None and hash_key in map_.entries else Number.false)
+
+    def execute_keys(self, map_):
+        if not isinstance(map_, Map):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a map", self.context))
+
+        return RuntimeResult().success(List([key for key, _ in map_.entries.values()]))
+
+    def execute_remove(self, map_, key):
+        if isinstance(map_, Set):
+            value = map_.members.pop(key.hash_key(), None)
+            if value is None:
+                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"{key!r} is not in set", self.context))
+
+            return RuntimeResult().success(value)
+
+        if not isinstance(map_, Map):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a map or a set", self.context))
 
+        entry = map_.entries.pop(key.hash_key(), None)
+        if entry is None:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Key {key!r} is not in map", self.context))
+
+        return RuntimeResult().success(entry[1])
+
+    def execute_to_set(self, list_):
+        iterator = list_.iterate()
+        if iterator is None:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be iterable", self.context))
+
+        try:
+            set_ = Set.from_elements(iterator)
+        except IterationError as ex:
+            return RuntimeResult().failure(ex.error)
+
+        if set_ is None:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Set members must be numbers or strings", self.context))
+
+        return RuntimeResult().success(set_)
+
+    def execute_to_list(self, set_):
+        if isinstance(set_, List):
+            return RuntimeResult().success(List(list(set_.elements)))
+
+        elements, error = self.collect(set_, "Argument must be iterable")
         if error:
-            return res.failure(error)
-            
-        return res.success(number.set_pos(node.pos_start, node.pos_end))
-    
-    def visit_IfNode(self, node, context):
-        res = RuntimeResult()
+            return RuntimeResult().failure(error)
 
-        for condition, expression, should_return_null in node.cases:
-            condition_value = res.register(self.visit(condition, context))
-            if res.should_return():
-                return res
+        return RuntimeResult().success(List(elements))
 
-            if condition_value.is_true():
-                expression_value = res.register(self.visit(expression, context))
-                if res.should_return():
-                    return res
-                return res.success(Number.null if should_return_null else expression_value)
+    def execute_iter(self, value):
+        iterator = value.iterate()
+        if iterator is None:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be iterable", self.context))
 
-        if node.else_case:
-            expr, should_return_null = node.else_case
-            expression_value = res.register(self.visit(expr, context))
-            if res.should_return():
-                return res
-            return res.success(Number.null if should_return_null else expression_value)
+        return RuntimeResult().success(value if isinstance(value, Iterator) else Iterator(iterator))
 
-        return res.success(Number.null)
-    
-    def visit_ForNode(self, node, context):
-        res = RuntimeResult()
-        elements = []
+    def execute_next(self, iterator, default=None):
+        if not isinstance(iterator, Iterator):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be an iterator", self.context))
 
-        start_value = res.register(self.visit(node.start_value_node, context))
-        if res.should_return():
-            return res
+        try:
+            return RuntimeResult().success(next(iterator.iterator))
+        except IterationError as ex:
+            return RuntimeResult().failure(ex.error)
+        except StopIteration:
+            if default is None:
+                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Iterator is exhausted", self.context))
+            return RuntimeResult().success(default)
+
+    def lazy_map(self, function, iterator):
+        for value in iterator:
+            res = function.execute([value])
+            if res.error:
+                raise IterationError(res.error)
+            yield res.value
 
-        end_value = res.register(self.visit(node.end_value_node, context))
-        if res.should_return():
-            return res
+    def lazy_filter(self, function, iterator):
+        for value in iterator:
+            res = function.execute([value])
+            if res.error:
+                raise IterationError(res.error)
+            if res.value.is_true():
+                yield value
 
-        if node.step_value_node:
-            step_value = res.register(self.visit(node.step_value_node, context))
-            if res.should_return():
-                return res
-        else:
-            step_value = Number(1)
+    def execute_map(self, values, function):
+        iterator = values.iterate()
+        if iterator is None:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be iterable", self.context))
 
-        i = start_value.value
+        if not isinstance(function, BaseFunction):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a function", self.context))
 
-        if step_value.value >= 0:
-            condition = lambda: i < end_value.value
+        return RuntimeResult().success(Iterator(self.lazy_map(function, iterator)))
+
+    def execute_filter(self, values, function):
+        iterator = values.iterate()
+        if iterator is None:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be iterable", self.context))
+
+        if not isinstance(function, BaseFunction):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a function", self.context))
+
+        return RuntimeResult().success(Iterator(self.lazy_filter(function, iterator)))
+
+    def execute_pmap(self, values, function, chunk_size=None):
+        global pmap_pool
+
+        elements, error = self.collect(values, "1st argument must be iterable")
+        if error:
+            return RuntimeResult().failure(error)
+
+        if not isinstance(function, BaseFunction):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a function", self.context))
+
+        # a few chunks per worker so uneven chunks still keep every worker busy
+        if chunk_size is None:
+            chunk_size = max(1, math.ceil(len(elements) / ((os.cpu_count() or 1) * 4)))
+        elif isinstance(chunk_size, Number) and chunk_size.value >= 1:
+            chunk_size = int(chunk_size.value)
         else:
-            condition = lambda: i > end_value.value
-		
-        while condition():
-            context.symbol_table.set(node.var_name_token.value, Number(i)) # for accessing i within the loop
-            i += step_value.value
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "3rd argument must be a positive number", self.context))
 
-            value = res.register(self.visit(node.body_node, context))
-            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
-                return res
-            
-            if res.loop_should_continue:
-                continue
-            
-            if res.loop_should_break:
-                break
+        closure = closure_snapshot(function, self.context)
+        results = []
 
-            elements.append(value)
+        # text printed before the pmap comes out before what the workers print
+        self.context.session.output.flush()
 
-        return res.success(Number.null if node.should_return_null else List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
-    
-    def visit_WhileNode(self, node, context):
-        res = RuntimeResult()
-        elements = []
+        try:
+            futures = [get_pmap_pool().submit(pmap_chunk, function, closure, elements[i:i + chunk_size]) for i in range(0, len(elements), chunk_size)]
+
+            for future in futures:
+                chunk_results, error_text = future.result()
+                if error_text:
+                    return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to finish pmap in a worker process\n{error_text}", self.context))
+                results.extend(chunk_results)
+        except process_pool.BrokenProcessPool as ex:
+            # a broken pool can't take new work, the next pmap starts a new one
+            pmap_pool = None
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"A pmap worker process stopped: {ex}", self.context))
+        except Exception as ex:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Can't run {function} in worker processes: {ex}", self.context))
 
-        while True:
-            condition = res.register(self.visit(node.condition_node, context))
-            if res.should_return():
-                return res
+        return RuntimeResult().success(List(results))
 
-            if not condition.is_true():
-                break
+    def execute_is_iterator(self, value):
+        is_iterator = isinstance(value, Iterator)
+        return RuntimeResult().success(Number.true if is_iterator else Number.false)
 
-            value = res.register(self.visit(node.body_node, context))
-            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
-                return res
-            
-            if res.loop_should_continue:
-                continue
-            
-            if res.loop_should_break:
-                break
+    def check_sets(self, setA, setB):
+        if not isinstance(setA, Set):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a set", self.context))
 
-            elements.append(value)
+        if not isinstance(setB, Set):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a set", self.context))
 
-        return res.success(Number.null if node.should_return_null else List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
-    
-    def visit_FunctionNode(self, node, context):
-        res = RuntimeResult()
+        return RuntimeResult().success(None)
 
-        function_name = node.var_name_token.value if node.var_name_token else None
-        body_node = node.body_node
-        arg_names = [arg_name.value for arg_name in node.arg_name_tokens]
-        function_value = Function(function_name, body_node, arg_names, node.should_auto_return).set_context(context).set_pos(node.pos_start, node.pos_end)
+    def execute_union(self, setA, setB):
+        res = self.check_sets(setA, setB)
+        if res.should_return():
+            return res
 
-        if node.var_name_token:
-            context.symbol_table.set(function_name, function_value)
-        
-        return res.success(function_value)
-    
-    def visit_CallNode(self, node, context):
-        res = RuntimeResult()
-        args = []
+        return res.success(setA.union(setB))
 
-        value_to_call = res.register(self.visit(node.node_to_call, context))
+    def execute_intersection(self, setA, setB):
+        res = self.check_sets(setA, setB)
         if res.should_return():
             return res
-        value_to_call = value_to_call.copy().set_pos(node.pos_start, node.pos_end)
 
-        for arg_node in node.arg_nodes:
-            args.append(res.register(self.visit(arg_node, context)))
-            if res.should_return():
-                return res
-            
-        return_value = res.register(value_to_call.execute(args))
+        return res.success(setA.intersection(setB))
+
+    def execute_difference(self, setA, setB):
+        res = self.check_sets(setA, setB)
         if res.should_return():
             return res
-        
-        return_value = return_value.copy().set_context(context).set_pos(node.pos_start, node.pos_end)
-        
-        return res.success(return_value)
-    
-    def visit_ContinueNode(self, node, context):
-        return RuntimeResult().success_continue()
-    
-    def visit_BreakNode(self, node, context):
-        return RuntimeResult().success_break()
-    
-    def visit_ReturnNode(self, node, context):
+
+        return res.success(setA.difference(setB))
+
+    def execute_is_set(self, value):
+        is_set = isinstance(value, Set)
+        return RuntimeResult().success(Number.true if is_set else Number.false)
+
+    def execute_sort(self, list_, key=None):
         res = RuntimeResult()
 
-        # may or may not return something
-        if node.node_to_return:
-            value = res.register(self.visit(node.node_to_return, context))
-            if res.should_return():
-                return res
-        else:
-            value = Number.null
-        
-        return res.success_return(value)
+        elements, error = self.collect(list_, "1st argument must be iterable")
+        if error:
+            return res.failure(error)
 
+        if key is not None and not isinstance(key, BaseFunction):
+            return res.failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a function", self.context))
 
-global_symbol_table = SymbolTable()
-global_symbol_table.set("NULL", Number.null)
-global_symbol_table.set("true", Number.false)
-global_symbol_table.set("false", Number.true)
-global_symbol_table.set("math_pi", Number.math_PI)
-global_symbol_table.set("print", BuiltinFunction.print)
-global_symbol_table.set("print_ret", BuiltinFunction.print_ret)
-global_symbol_table.set("input", BuiltinFunction.input)
-global_symbol_table.set("input_int", BuiltinFunction.input_int)
-global_symbol_table.set("clear", BuiltinFunction.clear)
-global_symbol_table.set("cls", BuiltinFunction.clear)
-global_symbol_table.set("is_num", BuiltinFunction.is_number)
-global_symbol_table.set("is_str", BuiltinFunction.is_string)
-global_symbol_table.set("is_list", BuiltinFunction.is_list)
-global_symbol_table.set("is_funcion", BuiltinFunction.is_function)
-global_symbol_table.set("append", BuiltinFunction.append)
-global_symbol_table.set("pop", BuiltinFunction.pop)
-global_symbol_table.set("extend", BuiltinFunction.extend)
-global_symbol_table.set("len", BuiltinFunction.len)
-global_symbol_table.set("run", BuiltinFunction.run)
+        # the key function is called once per element, timsort then only compares python values
+        sort_keys = []
 
-def run(text, file_name):
-    # generate tokens
-    lexer = Lexer(text, file_name)
-    tokens, error = lexer.make_token()
+        for element in elements:
+            if key is not None:
+                element = res.register(key.execute([element]))
+                if res.should_return():
+                    return res
 
-    if error:
-        return None, error
+            sort_key = element.hash_key()
+            if sort_key is None:
+                return res.failure(RuntimeError(self.pos_start, self.pos_end, "Sort keys must be numbers or strings", self.context))
 
-    # generate AST
-    parser = Parser(tokens)
-    ast = parser.parse()
+            sort_keys.append(sort_key)
+
+        try:
+            order = sorted(range(len(elements)), key=sort_keys.__getitem__)
+        except TypeError:
+            return res.failure(RuntimeError(self.pos_start, self.pos_end, "Can't sort numbers and strings together", self.context))
+
+        return res.success(List([elements[i] for i in order]))
+
+    def bisect_list(self, bisect_function, list_, value):
+        if not isinstance(list_, List):
+            return None, RuntimeError(self.pos_start, self.pos_end, "1st argument must be a list", self.context)
+
+        try:
+            return bisect_function(list_.elements, value.hash_key(), key=operator.methodcaller("hash_key")), None
+        except TypeError:
+            return None, RuntimeError(self.pos_start, self.pos_end, "List must be sorted and hold only numbers or only strings", self.context)
+
+    def execute_bisect_left(self, list_, value):
+        index, error = self.bisect_list(bisect.bisect_left, list_, value)
+        if error:
+            return RuntimeResult().failure(error)
+
+        return RuntimeResult().success(Number(index))
+
+    def execute_bisect_right(self, list_, value):
+        index, error = self.bisect_list(bisect.bisect_right, list_, value)
+        if error:
+            return RuntimeResult().failure(error)
+
+        return RuntimeResult().success(Number(index))
+
+    def execute_binary_search(self, list_, value):
+        index, error = self.bisect_list(bisect.bisect_left, list_, value)
+        if error:
+            return RuntimeResult().failure(error)
+
+        elements = list_.elements
+
+        if index < len(elements) and elements[index].hash_key() == value.hash_key():
+            return RuntimeResult().success(Number(index))
+
+        return RuntimeResult().success(Number(-1))
+
+    def execute_memo(self, function, max_size=None):
+        if isinstance(function, MemoFunction):
+            function = function.function
+
+        if not isinstance(function, BaseFunction):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a function", self.context))
+
+        # a generator function returns a single pass iterator, a cached one would be empty after the first use
+        if isinstance(function, Function) and function.is_generator:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Can't memoize generator function {function}", self.context))
+
+        if max_size is None:
+            max_size = 128
+        elif isinstance(max_size, Number) and max_size.value >= 1:
+            max_size = int(max_size.value)
+        else:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a positive number", self.context))
+
+        # basic purity check, only names used directly in the body are looked at
+        if isinstance(function, Function):
+            impure_calls = used_names(function.body_node) & IMPURE_BUILTINS
+        else:
+            impure_calls = {function.name} & IMPURE_BUILTINS
+
+        if impure_calls:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Can't memoize {function} because it uses {', '.join(sorted(impure_calls))}", self.context))
+
+        return RuntimeResult().success(MemoFunction(function, LRUCache(max_size)))
+
+    def execute_memo_stats(self, function):
+        if not isinstance(function, MemoFunction):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a memoized function", self.context))
+
+        cache = function.cache
+        stats = {"hits": cache.hits, "misses": cache.misses, "evictions": cache.evictions, "size": len(cache.entries)}
+
+        return RuntimeResult().success(Map({name: (String(name), Number(count)) for name, count in stats.items()}))
+
+    def execute_run(self, filename):
+        if not isinstance(filename, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a string", self.context))
+        
+        filename = filename.value
+        
+        try:
+            name, ext = os.path.splitext(filename)
+            if ext != ".ar":
+                return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Invalid file extension\n", self.context))
+
+            with open(filename, "r") as f:
+                script = f.read()
+        except Exception as ex:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to load script \"{filename}\"\n" + str(ex), self.context))
+        
+        _, error = self.context.session.run(script, filename)
+
+        if error:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to finish executing script \"{filename}\"\n" + error.as_string(), self.context))
+
+        return RuntimeResult().success(Number.null)
+
+    def execute_sleep(self, seconds):
+        if not isinstance(seconds, Number) or seconds.value < 0:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a positive number", self.context))
+
+        time.sleep(seconds.value)
+        return RuntimeResult().success(Number.null)
+
+    def execute_read_file(self, path):
+        if not isinstance(path, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a string", self.context))
+
+        try:
+            with open(path.value, "r") as f:
+                text = f.read()
+        except OSError as ex:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to read \"{path.value}\"\n" + str(ex), self.context))
+
+        return RuntimeResult().success(String(text))
+
+    def execute_read_lines(self, path):
+        # lines of an open file are read lazily, one at a time
+        if isinstance(path, File):
+            res = self.check_file(path, "r", "rb", "m")
+            if res.should_return():
+                return res
+            return res.success(Iterator(self.file_lines(path)))
+
+        res = self.execute_read_file(path)
+        if res.should_return():
+            return res
+
+        return res.success(List([String(line) for line in res.value.value.splitlines()]))
+
+    def file_lines(self, file):
+        stream = file.stream
+        mapped = file.mode == "m"
+
+        while True:
+            try:
+                line = stream.readline()
+            except ValueError:
+                raise IterationError(RuntimeError(self.pos_start, self.pos_end, f"File {file.path} was closed while reading its lines", self.context))
+
+            if not line:
+                break
+
+            if file.mode == "rb":
+                yield Bytes(line, 0, len(line) - 1 if line.endswith(b"\n") else len(line))
+                continue
+
+            if mapped:
+                line = line.decode(errors="replace")
+            yield String(line[:-1] if line.endswith("\n") else line)
+
+    def execute_write_file(self, path, text):
+        if not isinstance(path, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a string", self.context))
+
+        if not isinstance(text, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a string", self.context))
+
+        try:
+            with open(path.value, "w") as f:
+                f.write(text.value)
+        except OSError as ex:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to write \"{path.value}\"\n" + str(ex), self.context))
+
+        return RuntimeResult().success(Number.null)
+
+    def execute_spawn(self, function, args=None):
+        if not isinstance(function, BaseFunction):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a function", self.context))
+
+        if args is None:
+            args = []
+        elif isinstance(args, List):
+            args = args.elements
+        else:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a list", self.context))
+
+        session = self.context.session
+        task = session.spawn(AsyncInterpreter(session.quantum).call(function, args))
+
+        return RuntimeResult().success(Task(task))
+
+    def execute_wait(self, task):
+        if not isinstance(task, Task):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a task", self.context))
+
+        if not task.task.done():
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Can't wait for a task here, only in code run by the scheduler", self.context))
+
+        return task.task.result()
+
+    def execute_channel(self, capacity=None):
+        if capacity is None:
+            capacity = 1
+        elif isinstance(capacity, Number) and capacity.value >= 1:
+            capacity = int(capacity.value)
+        else:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a positive number", self.context))
+
+        return RuntimeResult().success(Channel(asyncio.Queue(capacity)))
+
+    def execute_send(self, channel, value):
+        if not isinstance(channel, Channel):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a channel", self.context))
+
+        try:
+            channel.queue.put_nowait(value)
+        except asyncio.QueueFull:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Channel is full, sending to it can only wait in code run by the scheduler", self.context))
+
+        return RuntimeResult().success(Number.null)
+
+    def execute_recv(self, channel):
+        if not isinstance(channel, Channel):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a channel", self.context))
+
+        try:
+            return RuntimeResult().success(channel.queue.get_nowait())
+        except asyncio.QueueEmpty:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Channel is empty, receiving from it can only wait in code run by the scheduler", self.context))
+
+    def execute_open(self, path, mode=None):
+        if not isinstance(path, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a string", self.context))
+
+        mode = "r" if mode is None else mode.value if isinstance(mode, String) else None
+        if mode not in ("r", "rb", "w", "a", "m"):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be \"r\", \"rb\", \"w\", \"a\" or \"m\"", self.context))
+
+        try:
+            if mode == "m":
+                # read only mapping, the pages are loaded on demand and not copied into the process
+                with open(path.value, "rb") as f:
+                    stream = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                stream = open(path.value, mode)
+        except (OSError, ValueError) as ex:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to open \"{path.value}\"\n" + str(ex), self.context))
+
+        return RuntimeResult().success(File(stream, path.value, mode))
+
+    # error unless the value is an open file with one of the modes
+    def check_file(self, file, *modes):
+        if not isinstance(file, File):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a file", self.context))
+
+        if file.stream.closed:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"File {file.path} is closed", self.context))
+
+        if file.mode not in modes:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"File {file.path} was opened with mode \"{file.mode}\"", self.context))
+
+        return RuntimeResult().success(None)
+
+    # the next size characters, or bytes for "rb" and mapped files, empty at the end of the file
+    def execute_read_chunk(self, file, size):
+        res = self.check_file(file, "r", "rb", "m")
+        if res.should_return():
+            return res
+
+        if not isinstance(size, Number) or size.value < 1:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a positive number", self.context))
+
+        # a slice of the mapping, without copying it
+        if file.mode == "m":
+            stream = file.stream
+            start = stream.tell()
+            end = min(start + int(size.value), len(stream))
+            stream.seek(end)
+            return res.success(Bytes(stream, start, end))
+
+        chunk = file.stream.read(int(size.value))
+        if file.mode == "rb":
+            return res.success(Bytes(chunk))
+
+        return res.success(String(chunk))
+
+    def execute_write(self, file, text):
+        res = self.check_file(file, "w", "a")
+        if res.should_return():
+            return res
+
+        if not isinstance(text, String):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "2nd argument must be a string", self.context))
+
+        # rope pieces are written one by one instead of being joined first
+        if text.flat is None:
+            file.stream.writelines(text.pieces[:text.piece_count])
+        else:
+            file.stream.write(text.flat)
+
+        return res.success(Number.null)
+
+    def execute_writeln(self, file, text):
+        res = self.execute_write(file, text)
+        if res.should_return():
+            return res
+
+        file.stream.write("\n")
+        return res
+
+    # flushes the session's output when no file is given
+    def execute_flush(self, file=None):
+        if file is None:
+            self.context.session.output.flush()
+            return RuntimeResult().success(Number.null)
+
+        res = self.check_file(file, "w", "a")
+        if res.should_return():
+            return res
+
+        file.stream.flush()
+        return res.success(Number.null)
+
+    def execute_close(self, file):
+        if not isinstance(file, File):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a file", self.context))
+
+        # bytes taken from a mapped file keep their data once it's unmapped
+        if file.mode == "m" and not file.stream.closed:
+            for view in [view for view in Bytes.mapped if view.buffer is file.stream]:
+                view.detach()
+
+        try:
+            file.stream.close()
+        except (OSError, BufferError) as ex: # BufferError while host code holds a memoryview of the mapping
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, f"Failed to close {file.path}\n" + str(ex), self.context))
+
+        return RuntimeResult().success(Number.null)
+
+    # Versions of the blocking builtins used when scripts run on an event loop, they take the same
+    # args after the arity check and let other scripts run while they wait
+    async def async_sleep(self, seconds):
+        if not isinstance(seconds, Number) or seconds.value < 0:
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a positive number", self.context))
+
+        await asyncio.sleep(seconds.value)
+        return RuntimeResult().success(Number.null)
+
+    async def async_read_file(self, path):
+        return await asyncio.to_thread(self.execute_read_file, path)
+
+    async def async_read_lines(self, path):
+        return await asyncio.to_thread(self.execute_read_lines, path)
+
+    async def async_write_file(self, path, text):
+        return await asyncio.to_thread(self.execute_write_file, path, text)
+
+    async def async_read_chunk(self, file, size):
+        return await asyncio.to_thread(self.execute_read_chunk, file, size)
+
+    async def async_flush(self, file=None):
+        return await asyncio.to_thread(self.execute_flush, file)
+
+    async def async_wait(self, task):
+        if not isinstance(task, Task):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a task", self.context))
+
+        # shielded so a deadlock cancelling this wait doesn't cancel the task too
+        result, error = await self.wait_blocked(asyncio.shield(task.task), not task.task.done())
+        return RuntimeResult().failure(error) if error else result
+
+    async def async_send(self, channel, value):
+        if not isinstance(channel, Channel):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "1st argument must be a channel", self.context))
+
+        _, error = await self.wait_blocked(channel.queue.put(value), channel.queue.full())
+        return RuntimeResult().failure(error) if error else RuntimeResult().success(Number.null)
+
+    async def async_recv(self, channel):
+        if not isinstance(channel, Channel):
+            return RuntimeResult().failure(RuntimeError(self.pos_start, self.pos_end, "Argument must be a channel", self.context))
+
+        value, error = await self.wait_blocked(channel.queue.get(), channel.queue.empty())
+        return RuntimeResult().failure(error) if error else RuntimeResult().success(value)
+
+    # (result, error) of waiting on a channel or a task. A script that blocks is counted as blocked, and once
+    # every script running on the session is, none of them can go on and they fail with a deadlock error
+    async def wait_blocked(self, awaitable, blocks):
+        if not blocks:
+            return await awaitable, None
+
+        session = self.context.session
+        task = asyncio.current_task()
+        session.blocked.add(task)
+
+        session.check_deadlock()
+
+        try:
+            return await awaitable, None
+        except asyncio.CancelledError:
+            if task not in session.deadlocked:
+                raise
+
+            session.deadlocked.discard(task)
+            return None, RuntimeError(self.pos_start, self.pos_end, "Deadlock, every task is waiting on a channel or another task", self.context)
+        finally:
+            session.blocked.discard(task)
+            session.progress += 1
+
+    async def async_input(self):
+        return await asyncio.to_thread(self.execute_input)
+
+    async def async_input_int(self):
+        return await asyncio.to_thread(self.execute_input_int)
+
+
+# arg counts and names of a builtin's python function, trailing args with defaults are optional
+def builtin_spec(function):
+    code = function.__code__
+    arg_names = list(code.co_varnames[1:code.co_argcount]) # without self
+    max_args = len(arg_names)
+    min_args = max_args - len(function.__defaults__ or ())
+
+    return function, min_args, max_args, arg_names
+
+BuiltinFunction.registry = {name[len("execute_"):]: builtin_spec(function) for name, function in vars(BuiltinFunction).items() if name.startswith("execute_")}
+BuiltinFunction.async_registry = {name[len("async_"):]: function for name, function in vars(BuiltinFunction).items() if name.startswith("async_")}
+
+
+class List(Value):
+    def __init__(self, elements):
+        super().__init__()
+        self.elements = elements
+
+    # append elements to list
+    def add(self, other):
+        new_list = self.copy()
+        new_list.elements.append(other)
+
+        return new_list, None
+
+    # remove element from list
+    def sub(self, other):
+        if isinstance(other, Number):
+            new_list = self.copy()
+            try:
+                new_list.elements.pop(other.value)
+
+                return new_list, None
+            except:
+                return None, RuntimeError(other.pos_start, other.pos_end, 'Element at this index could not be removed from list as index is out of bounds', self.context)
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    # concatenate to list to list
+    def mul(self, other):
+        if isinstance(other, List):
+            new_list = self.copy()
+            new_list.elements.extend(other.elements)
+
+            return new_list, None
+        else:
+            return None, Value.illegal_operation(self, other)
+
+    # get element from list
+    def div(self, other):
+        if isinstance(other, Number):
+            try:
+                return self.elements[other.value], None
+            except:
+                return None, RuntimeError(other.pos_start, other.pos_end, 'Element at this index could not be retrieved from list as index is out of bounds', self.context)
+        else:
+            return None, Value.illegal_operation(self, other)
+  
+    def contains(self, other):
+        hash_key = other.hash_key()
+
+        if hash_key is None:
+            found = any(x is other for x in self.elements)
+        else:
+            found = any(x.hash_key() == hash_key for x in self.elements)
+
+        return Number(int(found)).set_context(self.context), None
+
+    def iterate(self):
+        return iter(self.elements)
+  
+    def copy(self):
+        copy = List(self.elements)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+        
+        return copy
+    
+    def __str__(self) -> str:
+        return ", ".join([str(x) for x in self.elements])
+
+    def __repr__(self):
+        return f'[{", ".join([str(x) for x in self.elements])}]'
+
+
+class HostSequence(MutableSequence):
+    """Elements of a list that is a view of a python sequence, they are converted when read. The
+    sequence is converted in one pass into a list of its own the first time the list is changed,
+    so the python sequence is never modified. Elements converted to lists, maps and sets are kept,
+    so changes made to them are seen by later reads."""
+
+    def __init__(self, sequence):
+        self.sequence = sequence
+        self.converted = None
+        self.elements = {} # index -> converted mutable element
+
+    # converted element at a non negative index
+    def element(self, index):
+        if self.converted is not None:
+            return self.converted[index]
+
+        value = self.elements.get(index)
+        if value is None:
+            value = from_python(self.sequence[index], True)
+            if isinstance(value, (List, Map, Set)):
+                self.elements[index] = value
+        return value
+
+    def materialize(self):
+        if self.converted is None:
+            self.converted = [self.element(i) for i in range(len(self.sequence))]
+            self.elements = None
+        return self.converted
+
+    def __len__(self):
+        return len(self.sequence if self.converted is None else self.converted)
+
+    def __getitem__(self, index):
+        if self.converted is not None:
+            return self.converted[index]
+        if isinstance(index, slice):
+            return [self.element(i) for i in range(len(self.sequence))[index]]
+        return self.element(range(len(self.sequence))[index])
+
+    def __iter__(self):
+        if self.converted is not None:
+            return iter(self.converted)
+        return (self.element(i) for i in range(len(self.sequence)))
+
+    def __setitem__(self, index, value):
+        self.materialize()[index] = value
+
+    def __delitem__(self, index):
+        del self.materialize()[index]
+
+    def insert(self, index, value):
+        self.materialize().insert(index, value)
+
+
+class Map(Value):
+    def __init__(self, entries):
+        super().__init__()
+        self.entries = entries # hash key -> (key, value)
+
+    def unhashable_key(self, key):
+        return RuntimeError(key.pos_start, key.pos_end, "Map keys must be numbers or strings", self.context)
+
+    # get value from map
+    def div(self, other):
+        hash_key = other.hash_key()
+        if hash_key is None:
+            return None, self.unhashable_key(other)
+
+        entry = self.entries.get(hash_key)
+        if entry is None:
+            return None, RuntimeError(other.pos_start, other.pos_end, f"Key {other!r} is not in map", self.context)
+
+        return entry[1], None
+
+    def contains(self, other):
+        return Number(int(other.hash_key() in self.entries)).set_context(self.context), None
+
+    def iterate(self):
+        return (key for key, _ in self.entries.values())
+
+    def copy(self):
+        copy = Map(self.entries)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+
+        return copy
+
+    def __str__(self) -> str:
+        return ", ".join([f"{key!r}: {value!r}" for key, value in self.entries.values()])
+
+    def __repr__(self):
+        return f'{{{str(self)}}}'
+
+
+class Set(Value):
+    def __init__(self, members):
+        super().__init__()
+        self.members = members # hash key -> value
+
+    @staticmethod
+    def from_elements(elements):
+        members = {}
+
+        for element in elements:
+            hash_key = element.hash_key()
+            if hash_key is None:
+                return None
+            members.setdefault(hash_key, element)
+
+        return Set(members)
+
+    def contains(self, other):
+        return Number(int(other.hash_key() in self.members)).set_context(self.context), None
+
+    def iterate(self):
+        return iter(self.members.values())
+
+    def union(self, other):
+        members = dict(self.members)
+        for hash_key, value in other.members.items():
+            members.setdefault(hash_key, value)
+        return Set(members)
+
+    def intersection(self, other):
+        small, large = (self.members, other.members) if len(self.members) <= len(other.members) else (other.members, self.members)
+        return Set({hash_key: value for hash_key, value in small.items() if hash_key in large})
+
+    def difference(self, other):
+        return Set({hash_key: value for hash_key, value in self.members.items() if hash_key not in other.members})
+
+    def copy(self):
+        copy = Set(self.members)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+
+        return copy
+
+    def __str__(self) -> str:
+        return ", ".join([repr(x) for x in self.members.values()])
+
+    def __repr__(self):
+        return f'{{{str(self)}}}'
+
+
+# raised out of a python iterator when producing the next AROBAL value fails
+class IterationError(Exception):
+    def __init__(self, error):
+        super().__init__(error.details)
+        self.error = error
+
+
+# lazy, single pass sequence of values
+class Iterator(Value):
+    def __init__(self, iterator):
+        super().__init__()
+        self.iterator = iterator
+
+    def iterate(self):
+        return self.iterator
+
+    def copy(self):
+        copy = Iterator(self.iterator)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+
+        return copy
+
+    def __repr__(self):
+        return "<iterator>"
+    
+
+class File(Value):
+    def __init__(self, stream, path, mode):
+        super().__init__()
+        self.stream = stream # python file object, or an mmap for files opened with mode "m"
+        self.path = path
+        self.mode = mode
+
+    def copy(self):
+        copy = File(self.stream, self.path, self.mode)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+
+        return copy
+
+    def __repr__(self):
+        return f"<{'closed ' if self.stream.closed else ''}file {self.path}>"
+
+
+class Task(Value):
+    def __init__(self, task):
+        super().__init__()
+        self.task = task # asyncio task driving the function, its result is a RuntimeResult
+
+    def copy(self):
+        copy = Task(self.task)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+
+        return copy
+
+    def __repr__(self):
+        return "<task>" if self.task.done() else "<running task>"
+
+
+class Channel(Value):
+    def __init__(self, queue):
+        super().__init__()
+        self.queue = queue
+
+    def copy(self):
+        copy = Channel(self.queue)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+
+        return copy
+
+    def __repr__(self):
+        return f"<channel {self.queue.qsize()}/{self.queue.maxsize}>"
+
+
+# namespace of an imported script, shared by every script importing it
+class Module(Value):
+    def __init__(self, name, path, symbol_table):
+        super().__init__()
+        self.name = name
+        self.path = path
+        self.symbol_table = symbol_table # definitions made by the script, members are looked up only here
+
+    def copy(self):
+        copy = Module(self.name, self.path, self.symbol_table)
+        copy.set_pos(self.pos_start, self.pos_end)
+        copy.set_context(self.context)
+
+        return copy
+
+    def is_true(self):
+        return True
+
+    def __repr__(self):
+        return f"<module {self.name}>"
+    
+
+class Interpreter:
+    def visit(self, node, context):
+        method_name = f"visit_{type(node).__name__}"
+        method = getattr(self, method_name, self.no_visit_method)
+        return method(node, context)
+    
+    def no_visit_method(self, node, context):
+        raise Exception(f"No visit_{type(node).__name__} method defined")
+    
+    def visit_NumberNode(self, node, context):
+        return RuntimeResult().success(Number(node.token.value).set_context(context).set_pos(node.pos_start, node.pos_end))
+    
+    def visit_StringNode(self, node, context):
+        return RuntimeResult().success(String(node.token.value).set_context(context).set_pos(node.pos_start, node.pos_end))
+    
+    def visit_ListNode(self, node, context):
+        res = RuntimeResult()
+        elements = []
+
+        for element_node in node.element_nodes:
+            elements.append(res.register(self.visit(element_node, context)))
+
+            if res.should_return():
+                return res
+            
+        return res.success(List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+    
+    def visit_MapNode(self, node, context):
+        res = RuntimeResult()
+        entries = {}
+
+        for key_node, value_node in node.pair_nodes:
+            key = res.register(self.visit(key_node, context))
+            if res.should_return():
+                return res
+
+            value = res.register(self.visit(value_node, context))
+            if res.should_return():
+                return res
+
+            hash_key = key.hash_key()
+            if hash_key is None:
+                return res.failure(RuntimeError(key_node.pos_start, key_node.pos_end, "Map keys must be numbers or strings", context))
+
+            entries[hash_key] = (key, value)
+
+        return res.success(Map(entries).set_context(context).set_pos(node.pos_start, node.pos_end))
+    
+    def visit_VarAccessNode(self, node, context):
+        res = RuntimeResult()
+        var_name = node.var_name_token.value
+        value = context.symbol_table.get(var_name)
+
+        if not value:
+            return res.failure(RuntimeError(node.pos_start, node.pos_end, f"'{var_name}' is not defined", context))
+        
+        value = value.copy().set_context(context).set_pos(node.pos_start, node.pos_end)
+        return res.success(value)
+    
+    def visit_VarAssignNode(self, node, context):
+        res = RuntimeResult()
+        var_name = node.var_name_token.value
+        value = res.register(self.visit(node.value_node, context))
+
+        if res.should_return():
+            return res
+        
+        context.symbol_table.set(var_name, value)
+        return res.success(value)
+
+    # the module is also bound to the file's name, so `import "lib/shapes.ar"` defines shapes
+    def visit_ImportNode(self, node, context):
+        res = RuntimeResult()
+        module = res.register(context.session.import_module(node.path_token.value, node, context))
+
+        if res.should_return():
+            return res
+
+        if module.name.isidentifier() and module.name not in KEYWORDS:
+            context.symbol_table.set(module.name, module)
+
+        return res.success(module.copy().set_context(context).set_pos(node.pos_start, node.pos_end))
+
+    def visit_MemberAccessNode(self, node, context):
+        res = RuntimeResult()
+        value = res.register(self.visit(node.node, context))
+
+        if res.should_return():
+            return res
+
+        return self.member(value, node, context)
+
+    def member(self, value, node, context):
+        name = node.member_name_token.value
+
+        if not isinstance(value, Module):
+            return RuntimeResult().failure(RuntimeError(node.pos_start, node.pos_end, f"Can't get '{name}' of {value}, it isn't a module", context))
+
+        member = value.symbol_table.symbols.get(name)
+        if member is None:
+            return RuntimeResult().failure(RuntimeError(node.pos_start, node.pos_end, f"Module '{value.name}' has no member '{name}'", context))
+
+        # functions keep the module's context so they see the module's other definitions
+        member = member.copy().set_pos(node.pos_start, node.pos_end)
+        if not isinstance(member, BaseFunction):
+            member.set_context(context)
+
+        return RuntimeResult().success(member)
+
+    def visit_BinaryOperationNode(self, node, context):
+        res = RuntimeResult()
+        left = res.register(self.visit(node.left_node, context))
+        if res.should_return(): return res
+        right = res.register(self.visit(node.right_node, context))
+        if res.should_return(): return res
+
+        return self.binary_operation(node, left, right, res)
+
+    def binary_operation(self, node, left, right, res):
+        if node.op_token.type == TT_PLUS:
+            result, error = left.add(right)
+        elif node.op_token.type == TT_MINUS:
+            result, error = left.sub(right)
+        elif node.op_token.type == TT_MUL:
+            result, error = left.mul(right)
+        elif node.op_token.type == TT_DIV:
+            result, error = left.div(right)
+        elif node.op_token.type == TT_POW:
+            result, error = left.pow(right)
+        elif node.op_token.type == TT_EE:
+            result, error = left.compare_ee(right)
+        elif node.op_token.type == TT_NE:
+            result, error = left.compare_ne(right)
+        elif node.op_token.type == TT_LT:
+            result, error = left.compare_lt(right)
+        elif node.op_token.type == TT_GT:
+            result, error = left.compare_gt(right)
+        elif node.op_token.type == TT_LTE:
+            result, error = left.compare_lte(right)
+        elif node.op_token.type == TT_GTE:
+            result, error = left.compare_gte(right)
+        elif node.op_token.matches(TT_KEYWORD, "and"):
+            result, error = left.ander(right)
+        elif node.op_token.matches(TT_KEYWORD, "or"):
+            result, error = left.orer(right)
+        elif node.op_token.matches(TT_KEYWORD, "in"):
+            result, error = right.contains(left)
+
+
+        if error:
+            return res.failure(error)
+
+        return res.success(result.set_pos(node.pos_start, node.pos_end))
+    
+    def visit_UnaryOperationNode(self, node, context):
+        res = RuntimeResult()
+        number = res.register(self.visit(node.node, context))
+        if res.should_return():
+            return res
+
+        return self.unary_operation(node, number, res)
+
+    def unary_operation(self, node, number, res):
+        if node.op_token.type == TT_MINUS:
+            number, error = number.mul(Number(-1))
+        elif node.op_token.matches(TT_KEYWORD, "not"):
+            number, error = number.notter()
+
+        if error:
+            return res.failure(error)
+            
+        return res.success(number.set_pos(node.pos_start, node.pos_end))
+    
+    def visit_IfNode(self, node, context):
+        res = RuntimeResult()
+
+        for condition, expression, should_return_null in node.cases:
+            condition_value = res.register(self.visit(condition, context))
+            if res.should_return():
+                return res
+
+            if condition_value.is_true():
+                expression_value = res.register(self.visit(expression, context))
+                if res.should_return():
+                    return res
+                return res.success(Number.null if should_return_null else expression_value)
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            expression_value = res.register(self.visit(expr, context))
+            if res.should_return():
+                return res
+            return res.success(Number.null if should_return_null else expression_value)
+
+        return res.success(Number.null)
+    
+    def visit_ForNode(self, node, context):
+        res = RuntimeResult()
+        elements = []
+
+        start_value = res.register(self.visit(node.start_value_node, context))
+        if res.should_return():
+            return res
+
+        end_value = res.register(self.visit(node.end_value_node, context))
+        if res.should_return():
+            return res
+
+        if node.step_value_node:
+            step_value = res.register(self.visit(node.step_value_node, context))
+            if res.should_return():
+                return res
+        else:
+            step_value = Number(1)
+
+        i = start_value.value
+
+        if step_value.value >= 0:
+            condition = lambda: i < end_value.value
+        else:
+            condition = lambda: i > end_value.value
+		
+        while condition():
+            context.symbol_table.set(node.var_name_token.value, Number(i)) # for accessing i within the loop
+            i += step_value.value
+
+            value = res.register(self.visit(node.body_node, context))
+            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
+                return res
+            
+            if res.loop_should_continue:
+                continue
+            
+            if res.loop_should_break:
+                break
+
+            if not node.should_return_null:
+                elements.append(value)
+
+        return res.success(Number.null if node.should_return_null else List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+    
+    def visit_ForInNode(self, node, context):
+        res = RuntimeResult()
+        elements = []
+
+        iterable = res.register(self.visit(node.iterable_node, context))
+        if res.should_return():
+            return res
+
+        iterator = iterable.iterate()
+        if iterator is None:
+            return res.failure(RuntimeError(node.iterable_node.pos_start, node.iterable_node.pos_end, "Value can't be iterated over", context))
+
+        # walks the python iterator directly, no index numbers or bounds checks per step
+        var_name = node.var_name_token.value
+        set_variable = context.symbol_table.set
+
+        try:
+            for element in iterator:
+                set_variable(var_name, element)
+
+                value = res.register(self.visit(node.body_node, context))
+                if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
+                    return res
+                
+                if res.loop_should_continue:
+                    continue
+                
+                if res.loop_should_break:
+                    break
+
+                if not node.should_return_null:
+                    elements.append(value)
+        except IterationError as ex:
+            return res.failure(ex.error)
+
+        return res.success(Number.null if node.should_return_null else List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+    
+    def visit_WhileNode(self, node, context):
+        res = RuntimeResult()
+        elements = []
+
+        while True:
+            condition = res.register(self.visit(node.condition_node, context))
+            if res.should_return():
+                return res
+
+            if not condition.is_true():
+                break
+
+            value = res.register(self.visit(node.body_node, context))
+            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
+                return res
+            
+            if res.loop_should_continue:
+                continue
+            
+            if res.loop_should_break:
+                break
+
+            if not node.should_return_null:
+                elements.append(value)
+
+        return res.success(Number.null if node.should_return_null else List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+    
+    def visit_FunctionNode(self, node, context):
+        res = RuntimeResult()
+
+        function_name = node.var_name_token.value if node.var_name_token else None
+        body_node = node.body_node
+        arg_names = [arg_name.value for arg_name in node.arg_name_tokens]
+        function_value = Function(function_name, body_node, arg_names, node.should_auto_return, node.is_generator).set_context(context).set_pos(node.pos_start, node.pos_end)
+
+        if node.var_name_token:
+            context.symbol_table.set(function_name, function_value)
+        
+        return res.success(function_value)
+    
+    def visit_CallNode(self, node, context):
+        res = RuntimeResult()
+        args = []
+
+        value_to_call = res.register(self.visit(node.node_to_call, context))
+        if res.should_return():
+            return res
+
+        # variable access already hands out a copy, callees found other ways, like in a list, are stored values
+        if not isinstance(node.node_to_call, VarAccessNode):
+            value_to_call = value_to_call.copy()
+        value_to_call.set_pos(node.pos_start, node.pos_end)
+
+        for arg_node in node.arg_nodes:
+            args.append(res.register(self.visit(arg_node, context)))
+            if res.should_return():
+                return res
+            
+        return_value = res.register(value_to_call.execute(args))
+        if res.should_return():
+            return res
+        
+        return_value = return_value.copy().set_context(context).set_pos(node.pos_start, node.pos_end)
+        
+        return res.success(return_value)
+    
+    def visit_ContinueNode(self, node, context):
+        return RuntimeResult().success_continue()
+    
+    def visit_BreakNode(self, node, context):
+        return RuntimeResult().success_break()
+    
+    def visit_ReturnNode(self, node, context):
+        res = RuntimeResult()
+
+        # may or may not return something
+        if node.node_to_return:
+            value = res.register(self.visit(node.node_to_return, context))
+            if res.should_return():
+                return res
+        else:
+            value = Number.null
+        
+        return res.success_return(value)
+
+    def visit_YieldNode(self, node, context):
+        return RuntimeResult().failure(RuntimeError(node.pos_start, node.pos_end, "'yield' can only be used as a statement", context))
+
+
+Interpreter.shared = Interpreter() # the interpreter keeps no state, so one instance runs every call
+
+
+class GeneratorInterpreter(Interpreter):
+    # visits the statements of a generator function as python generators that are suspended at
+    # every yield, anything that can't hold a yield statement goes through the normal visit
+    def resume(self, node, context):
+        method = getattr(self, f"resume_{type(node).__name__}", None)
+        if method is None:
+            return self.visit(node, context)
+        return (yield from method(node, context))
+
+    def resume_MemberAccessNode(self, node, context):
+        res = RuntimeResult()
+        value = res.register((yield from self.resume(node.node, context)))
+
+        if res.should_return():
+            return res
+
+        return self.member(value, node, context)
+
+    def resume_ListNode(self, node, context):
+        res = RuntimeResult()
+        elements = []
+
+        for element_node in node.element_nodes:
+            elements.append(res.register((yield from self.resume(element_node, context))))
+
+            if res.should_return():
+                return res
+            
+        return res.success(List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+
+    def resume_IfNode(self, node, context):
+        res = RuntimeResult()
+
+        for condition, expression, should_return_null in node.cases:
+            condition_value = res.register((yield from self.resume(condition, context)))
+            if res.should_return():
+                return res
+
+            if condition_value.is_true():
+                expression_value = res.register((yield from self.resume(expression, context)))
+                if res.should_return():
+                    return res
+                return res.success(Number.null if should_return_null else expression_value)
+
+        if node.else_case:
+            expr, should_return_null = node.else_case
+            expression_value = res.register((yield from self.resume(expr, context)))
+            if res.should_return():
+                return res
+            return res.success(Number.null if should_return_null else expression_value)
+
+        return res.success(Number.null)
+
+    def resume_ForNode(self, node, context):
+        res = RuntimeResult()
+        elements = []
+
+        start_value = res.register((yield from self.resume(node.start_value_node, context)))
+        if res.should_return():
+            return res
+
+        end_value = res.register((yield from self.resume(node.end_value_node, context)))
+        if res.should_return():
+            return res
+
+        if node.step_value_node:
+            step_value = res.register((yield from self.resume(node.step_value_node, context)))
+            if res.should_return():
+                return res
+        else:
+            step_value = Number(1)
+
+        i = start_value.value
+
+        if step_value.value >= 0:
+            condition = lambda: i < end_value.value
+        else:
+            condition = lambda: i > end_value.value
+		
+        while condition():
+            context.symbol_table.set(node.var_name_token.value, Number(i))
+            i += step_value.value
+
+            value = res.register((yield from self.resume(node.body_node, context)))
+            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
+                return res
+            
+            if res.loop_should_continue:
+                continue
+            
+            if res.loop_should_break:
+                break
+
+            if not node.should_return_null:
+                elements.append(value)
+
+        return res.success(Number.null if node.should_return_null else List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+
+    def resume_ForInNode(self, node, context):
+        res = RuntimeResult()
+        elements = []
+
+        iterable = res.register((yield from self.resume(node.iterable_node, context)))
+        if res.should_return():
+            return res
+
+        iterator = iterable.iterate()
+        if iterator is None:
+            return res.failure(RuntimeError(node.iterable_node.pos_start, node.iterable_node.pos_end, "Value can't be iterated over", context))
+
+        var_name = node.var_name_token.value
+        set_variable = context.symbol_table.set
+
+        try:
+            for element in iterator:
+                set_variable(var_name, element)
+
+                value = res.register((yield from self.resume(node.body_node, context)))
+                if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
+                    return res
+                
+                if res.loop_should_continue:
+                    continue
+                
+                if res.loop_should_break:
+                    break
+
+                if not node.should_return_null:
+                    elements.append(value)
+        except IterationError as ex:
+            return res.failure(ex.error)
+
+        return res.success(Number.null if node.should_return_null else List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+
+    def resume_WhileNode(self, node, context):
+        res = RuntimeResult()
+        elements = []
+
+        while True:
+            condition = res.register((yield from self.resume(node.condition_node, context)))
+            if res.should_return():
+                return res
+
+            if not condition.is_true():
+                break
+
+            value = res.register((yield from self.resume(node.body_node, context)))
+            if res.should_return() and res.loop_should_continue == False and res.loop_should_break == False:
+                return res
+            
+            if res.loop_should_continue:
+                continue
+            
+            if res.loop_should_break:
+                break
+
+            if not node.should_return_null:
+                elements.append(value)
+
+        return res.success(Number.null if node.should_return_null else List(elements).set_context(context).set_pos(node.pos_start, node.pos_end))
+
+    def resume_YieldNode(self, node, context):
+        res = RuntimeResult()
+
+        if node.node_to_yield:
+            value = res.register((yield from self.resume(node.node_to_yield, context)))
+            if res.should_return():
+                return res
+        else:
+            value = Number.null
+
+        yield value
+        return res.success(Number.null)
+
+
+# yielded by AsyncInterpreter when the script has to wait, the result of the awaitable is sent back
+class Suspend:
+    def __init__(self, awaitable):
+        self.awaitable = awaitable
+
+
+# whether evaluating the node makes any call or loops, only calls can suspend the script and
+# loops are where it can run long enough to be switched out
+def can_suspend(node):
+    try:
+        return node.can_suspend
+    except AttributeError:
+        node.can_suspend = any(isinstance(n, (CallNode, ForNode, ForInNode, WhileNode)) for n in walk_nodes(node))
+        return node.can_suspend
+
+# whether the script calls builtins that need it to run on an event loop
+def uses_tasks(node):
+    try:
+        return node.uses_tasks
+    except AttributeError:
+        node.uses_tasks = bool(used_names(node) & TASK_BUILTINS)
+        return node.uses_tasks
+
+def running_loop():
+    if "asyncio" not in sys.modules:
+        return None # nothing imported asyncio, so no loop can be running
+
+    try:
+        return asyncio.get_running_loop()
+    except Exception: # python's RuntimeError, the name is taken by the one in this module
+        return None
+
+
+class AsyncInterpreter(GeneratorInterpreter):
+    """Resumes whole scripts as python generators that yield a Suspend wherever an async builtin
+    is called, so an event loop can run other scripts while one of them waits.
+
+    Nodes that make no calls are visited normally. Builtins calling back into AROBAL functions
+    (map, sort, pmap, ...) and generator function bodies still run eagerly, async builtins
+    called from those block like they do in a normal run.
+
+    With a quantum, the script also suspends after that many resumed nodes so other tasks get to
+    run during long loops.
+    """
+
+    def __init__(self, quantum=None):
+        self.quantum = quantum
+        self.steps = 0
+
+    def resume(self, node, context):
+        self.steps += 1
+        if self.steps == self.quantum:
+            self.steps = 0
+            yield Suspend(asyncio.sleep(0))
+
+        method = getattr(self, f"resume_{type(node).__name__}", None)
+        if method is None or not can_suspend(node):
+            return self.visit(node, context)
+
+        return (yield from method(node, context))
+
+    def resume_MapNode(self, node, context):
+        res = RuntimeResult()
+        entries = {}
+
+        for key_node, value_node in node.pair_nodes:
+            key = res.register((yield from self.resume(key_node, context)))
+            if res.should_return():
+                return res
+
+            value = res.register((yield from self.resume(value_node, context)))
+            if res.should_return():
+                return res
+
+            hash_key = key.hash_key()
+            if hash_key is None:
+                return res.failure(RuntimeError(key_node.pos_start, key_node.pos_end, "Map keys must be numbers or strings", context))
+
+            entries[hash_key] = (key, value)
+
+        return res.success(Map(entries).set_context(context).set_pos(node.pos_start, node.pos_end))
+
+    def resume_VarAssignNode(self, node, context):
+        res = RuntimeResult()
+        value = res.register((yield from self.resume(node.value_node, context)))
+
+        if res.should_return():
+            return res
+
+        context.symbol_table.set(node.var_name_token.value, value)
+        return res.success(value)
+
+    def resume_BinaryOperationNode(self, node, context):
+        res = RuntimeResult()
+        left = res.register((yield from self.resume(node.left_node, context)))
+        if res.should_return(): return res
+        right = res.register((yield from self.resume(node.right_node, context)))
+        if res.should_return(): return res
+
+        return self.binary_operation(node, left, right, res)
+
+    def resume_UnaryOperationNode(self, node, context):
+        res = RuntimeResult()
+        number = res.register((yield from self.resume(node.node, context)))
+        if res.should_return():
+            return res
+
+        return self.unary_operation(node, number, res)
+
+    def resume_CallNode(self, node, context):
+        res = RuntimeResult()
+        args = []
+
+        value_to_call = res.register((yield from self.resume(node.node_to_call, context)))
+        if res.should_return():
+            return res
+
+        if not isinstance(node.node_to_call, VarAccessNode):
+            value_to_call = value_to_call.copy()
+        value_to_call.set_pos(node.pos_start, node.pos_end)
+
+        for arg_node in node.arg_nodes:
+            args.append(res.register((yield from self.resume(arg_node, context))))
+            if res.should_return():
+                return res
+
+        return_value = res.register((yield from self.call(value_to_call, args)))
+        if res.should_return():
+            return res
+
+        return_value = return_value.copy().set_context(context).set_pos(node.pos_start, node.pos_end)
+
+        return res.success(return_value)
+
+    # result of calling the function, suspending the script while async builtins run
+    def call(self, function, args):
+        if isinstance(function, Function) and not function.is_generator:
+            return (yield from function.resume(args, self))
+
+        if isinstance(function, BuiltinFunction) and function.async_function and function.min_args <= len(args) <= function.max_args:
+            return (yield Suspend(function.async_function(function, *args)))
+
+        return function.execute(args)
+
+    def resume_ReturnNode(self, node, context):
+        res = RuntimeResult()
+
+        value = res.register((yield from self.resume(node.node_to_return, context)))
+        if res.should_return():
+            return res
+
+        return res.success_return(value)
+
+
+# runs a script resumed by an AsyncInterpreter to the end, awaiting what it suspends on
+async def drive(resumed):
+    result = None
+
+    while True:
+        try:
+            suspend = resumed.send(result)
+        except StopIteration as ex:
+            return ex.value
+
+        result = await suspend.awaitable
+
+
+# Host extension API, for embedding applications to add builtins written in python
+
+# raised out of python code when an AROBAL function it called back into fails
+class CallbackError(Exception):
+    def __init__(self, error):
+        super().__init__(error.details)
+        self.error = error
+
+
+# python version of a value, lists and maps are converted in a single pass and iterators stay lazy,
+# lists that are unchanged views of a python sequence, with none of their lists, maps or sets read yet,
+# give back that sequence
+def to_python(value):
+    if isinstance(value, (Number, String)):
+        return value.value
+    if isinstance(value, List):
+        elements = value.elements
+        if isinstance(elements, HostSequence) and elements.converted is None and not elements.elements:
+            return elements.sequence
+        return [x.value if type(x) in (Number, String) else to_python(x) for x in elements]
+    if isinstance(value, Map):
+        return {to_python(key): to_python(x) for key, x in value.entries.values()}
+    if isinstance(value, Set):
+        return set(value.members)
+    if isinstance(value, Bytes):
+        return value.view()
+    if isinstance(value, Iterator):
+        return map(to_python, value.iterator)
+    if isinstance(value, BaseFunction):
+        return host_callable(value)
+    return value
+
+# value for a python object, strings are used without copying them. With lazy=True lists, tuples and
+# arrays become views that convert their elements when they are read, otherwise they're converted
+# in a single pass
+def from_python(obj, lazy=False):
+    if type(obj) in (int, float):
+        return Number(obj)
+    if isinstance(obj, Value):
+        return obj
+    if obj is None:
+        return Number.null
+    if isinstance(obj, (bool, int, float)):
+        return Number(int(obj) if isinstance(obj, bool) else obj)
+    if isinstance(obj, str):
+        return String(obj)
+    if isinstance(obj, (bytes, bytearray)):
+        return Bytes(obj)
+    if isinstance(obj, memoryview):
+        return Bytes(obj.tobytes())
+    if isinstance(obj, (list, tuple, array.array)):
+        if lazy:
+            return List(HostSequence(obj))
+        return List([from_python(x) for x in obj])
+    if isinstance(obj, dict):
+        entries = {}
+        for key, x in obj.items():
+            key = from_python(key)
+            entries[hash_key_of(key)] = (key, from_python(x))
+        return Map(entries)
+    if isinstance(obj, (set, frozenset)):
+        members = {}
+        for x in obj:
+            x = from_python(x)
+            members[hash_key_of(x)] = x
+        return Set(members)
+    if hasattr(obj, "__next__"):
+        return Iterator(map(from_python, obj))
+    raise TypeError(f"Can't convert {type(obj).__name__} to an AROBAL value")
+
+# hash key of a converted map key or set member, only numbers, strings and bytes can be keys
+def hash_key_of(value):
+    hash_key = value.hash_key()
+    if hash_key is None:
+        raise TypeError(f"Can't use {type(value).__name__} {value!r} as a map key or set member, only numbers, strings and bytes can be")
+    return hash_key
+
+# python function that calls an AROBAL function with python args
+def host_callable(function):
+    def call(*args):
+        res = function.execute([from_python(arg) for arg in args])
+        if res.error:
+            raise CallbackError(res.error)
+        return to_python(res.value)
+
+    return call
+
+
+# declared arg type -> (value class, conversion to python or None to pass the value as is)
+HOST_ARG_TYPES = {
+    "number": (Number, to_python),
+    "string": (String, to_python),
+    "bytes": (Bytes, to_python),
+    "list": (List, to_python),
+    "map": (Map, to_python),
+    "set": (Set, to_python),
+    "iterator": (Iterator, to_python),
+    "function": (BaseFunction, to_python),
+    "any": (Value, to_python),
+    "value": (Value, None),
+}
+
+ORDINALS = ["1st", "2nd", "3rd"]
+
+
+def register_builtin(name, function, arg_types=None, lazy=False, symbol_table=None):
+    """Make a python function callable from AROBAL as `name`.
+
+    arg_types has one entry per positional parameter of function (see HOST_ARG_TYPES), every arg
+    is checked against it and converted to python, "value" args are passed through unconverted.
+    Parameters with defaults are optional. The return value is converted back with from_python,
+    lazily when lazy is set.
+    """
+    parameters = [p for p in inspect.signature(function).parameters.values() if p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)]
+    arg_names = [p.name for p in parameters]
+    min_args = len([p for p in parameters if p.default is p.empty])
+
+    arg_types = list(arg_types or ["any"] * len(parameters))
+    if len(arg_types) != len(parameters):
+        raise ValueError(f"{name} takes {len(parameters)} args but {len(arg_types)} arg types were declared")
+
+    conversions = []
+    for type_name in arg_types:
+        if type_name not in HOST_ARG_TYPES:
+            raise ValueError(f"Unknown arg type '{type_name}', expected one of {', '.join(HOST_ARG_TYPES)}")
+        conversions.append(HOST_ARG_TYPES[type_name])
+
+    def call(builtin, *args):
+        python_args = []
+
+        for i, arg in enumerate(args):
+            value_class, convert = conversions[i]
+
+            if not isinstance(arg, value_class):
+                ordinal = ORDINALS[i] if i < len(ORDINALS) else f"{i + 1}th"
+                return RuntimeResult().failure(RuntimeError(builtin.pos_start, builtin.pos_end, f"{ordinal} argument must be a {arg_types[i]}", builtin.context))
+
+            python_args.append(arg if convert is None else convert(arg))
+
+        try:
+            return RuntimeResult().success(from_python(function(*python_args), lazy))
+        except (CallbackError, IterationError) as ex:
+            return RuntimeResult().failure(ex.error)
+        except Exception as ex:
+            return RuntimeResult().failure(RuntimeError(builtin.pos_start, builtin.pos_end, f"{type(ex).__name__} in {name}: {ex}", builtin.context))
+
+    # the spec isn't put in the registry, so sessions can register different functions under one name
+    builtin = BuiltinFunction(name, (call, min_args, len(parameters), arg_names))
+    (symbol_table or global_symbol_table).set(name, builtin)
+
+    return builtin
+
+
+# global name -> builtin function it's bound to, made the first time the name is looked up
+BUILTIN_NAMES = {
+    "print": "print",
+    "print_ret": "print_ret",
+    "input": "input",
+    "input_int": "input_int",
+    "clear": "clear",
+    "cls": "clear",
+    "is_num": "is_number",
+    "is_str": "is_string",
+    "is_list": "is_list",
+    "is_funcion": "is_function",
+    "append": "append",
+    "pop": "pop",
+    "extend": "extend",
+    "len": "len",
+    "join": "join",
+    "split": "split",
+    "substring": "substring",
+    "format": "format",
+    "find": "find",
+    "to_bytes": "to_bytes",
+    "decode": "decode",
+    "parse_int": "parse_int",
+    "get": "get",
+    "put": "put",
+    "has": "has",
+    "keys": "keys",
+    "remove": "remove",
+    "to_set": "to_set",
+    "to_list": "to_list",
+    "union": "union",
+    "intersection": "intersection",
+    "difference": "difference",
+    "is_set": "is_set",
+    "sort": "sort",
+    "bisect_left": "bisect_left",
+    "bisect_right": "bisect_right",
+    "binary_search": "binary_search",
+    "iter": "iter",
+    "next": "next",
+    "map": "map",
+    "filter": "filter",
+    "is_iterator": "is_iterator",
+    "pmap": "pmap",
+    "memo": "memo",
+    "memo_stats": "memo_stats",
+    "run": "run",
+    "sleep": "sleep",
+    "read_file": "read_file",
+    "read_lines": "read_lines",
+    "write_file": "write_file",
+    "spawn": "spawn",
+    "wait": "wait",
+    "channel": "channel",
+    "send": "send",
+    "recv": "recv",
+    "open": "open",
+    "read_chunk": "read_chunk",
+    "write": "write",
+    "writeln": "writeln",
+    "flush": "flush",
+    "close": "close"
+}
+
+global_symbol_table = BuiltinSymbolTable(BUILTIN_NAMES)
+global_symbol_table.set("NULL", Number.null)
+global_symbol_table.set("true", Number.false)
+global_symbol_table.set("false", Number.true)
+global_symbol_table.set("math_pi", Number.math_PI)
+
+# Output sinks, print writes to the session's output instead of sys.stdout
+
+class BufferedOutput:
+    """Collects output and writes it to the stream in large pieces, when buffer_size characters
+    are collected and on flush. Without a stream it writes to sys.stdout as it is at flush time."""
+
+    def __init__(self, stream=None, buffer_size=65536):
+        self.stream = stream
+        self.buffer_size = buffer_size
+        self.pieces = []
+        self.size = 0
+
+    def write(self, text):
+        self.pieces.append(text)
+        self.size += len(text)
+
+        if self.size >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.pieces:
+            stream = self.stream or sys.stdout
+            stream.write("".join(self.pieces))
+            stream.flush()
+
+            self.pieces = []
+            self.size = 0
+
+
+class CaptureOutput:
+    """Keeps all output in memory, for embedding applications to read with getvalue()."""
+
+    def __init__(self):
+        self.pieces = []
+
+    def write(self, text):
+        self.pieces.append(text)
+
+    def flush(self):
+        pass
+
+    def getvalue(self):
+        return "".join(self.pieces)
+
+    def clear(self):
+        self.pieces = []
+
+
+class NullOutput:
+    def write(self, text):
+        pass
+
+    def flush(self):
+        pass
+
+
+# path of a script imported by the import node, relative to the importing script
+def resolve_import(path, node):
+    importer = node.pos_start.file_name
+    base = os.path.dirname(importer) if os.path.isfile(importer) else ""
+    return os.path.realpath(os.path.join(base, path))
+
+# text that's the same for values with the same content, for result cache keys. TypeError for values
+# like functions and files that can't be compared by content
+def canonical_text(obj):
+    if isinstance(obj, Value):
+        if not isinstance(obj, (Number, String, List, Map, Set, Bytes)):
+            raise TypeError(f"Can't make a cache key for {obj}")
+        obj = to_python(obj)
+
+    if obj is None or isinstance(obj, (bool, int, float, str, bytes)):
+        return repr(obj)
+    if isinstance(obj, (bytearray, memoryview)):
+        return repr(bytes(obj))
+    if isinstance(obj, (list, tuple, array.array)):
+        return "[" + ",".join(map(canonical_text, obj)) + "]"
+    if isinstance(obj, dict):
+        return "{" + ",".join(sorted(f"{canonical_text(key)}:{canonical_text(value)}" for key, value in obj.items())) + "}"
+    if isinstance(obj, (set, frozenset)):
+        return "{" + ",".join(sorted(map(canonical_text, obj))) + "}"
+
+    raise TypeError(f"Can't make a cache key for {type(obj).__name__}")
+
+# whether the value only holds numbers, strings, bytes and lists, maps and sets of them, each list
+# and map appearing once
+def is_plain_data(value):
+    values = [value]
+    seen = set() # ids of the lists and maps met
+
+    while values:
+        value = values.pop()
+
+        if isinstance(value, (List, Map)):
+            if id(value) in seen:
+                return False
+            seen.add(id(value))
+
+            if isinstance(value, List):
+                values.extend(value.elements)
+            else:
+                for key, x in value.entries.values():
+                    values += (key, x)
+        elif not isinstance(value, (Number, String, Set, Bytes)):
+            return False
+
+    return True
+
+
+class ResultCache:
+    """Results of deterministic programs, keyed by their sources and inputs.
+
+    The max_entries most recently used results are kept in memory. With a directory they're also
+    kept in files there, and the least recently used files are removed once they take more than
+    max_disk_bytes, so results survive restarts and are shared by processes using the directory.
+    Results are stored in the serialize format, which only holds plain values, so files put in the
+    directory by others can't run code. Every hit gets its own copy.
+    """
+
+    def __init__(self, max_entries=1024, directory=None, max_disk_bytes=64 * 1024 * 1024):
+        self.memory = LRUCache(max_entries)
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self.disk_size = None # bytes used by the files, found when the first result is stored
+
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    # serialized result or None
+    def get(self, key):
+        data = self.memory.get(key)
+
+        if data is None and self.directory:
+            path = os.path.join(self.directory, key)
+
+            try:
+                with open(path, "rb") as f:
+                    data = f.read()
+                os.utime(path) # the modification time orders the files by last use
+            except OSError:
+                return None
+
+            self.memory.put(key, data)
+
+        return data
+
+    def put(self, key, data):
+        self.memory.put(key, data)
+
+        if not self.directory:
+            return
+
+        path = os.path.join(self.directory, key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError:
+            return
+
+        if self.disk_size is None:
+            self.trim()
+        else:
+            self.disk_size += len(data)
+            if self.disk_size > self.max_disk_bytes:
+                self.trim()
+
+    # removes the least recently used files until they fit in max_disk_bytes
+    def trim(self):
+        files = []
+
+        for entry in os.scandir(self.directory):
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue # removed by another process
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        files.sort()
+        self.disk_size = sum(size for _, size, _ in files)
+
+        for _, size, path in files:
+            if self.disk_size <= self.max_disk_bytes:
+                break
+
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            self.disk_size -= size
+
+
+class Session:
+    """Isolated globals to run scripts in.
+
+    Definitions are made in the session's own symbol table, which falls back to the shared
+    global_symbol_table for builtins, so creating a session doesn't copy anything and scripts
+    can shadow builtins without affecting other sessions. A session is meant to be used by
+    one thread at a time, separate sessions can run concurrently.
+
+    Scripts using tasks or channels run on the session's own event loop when they aren't run on
+    one already, tasks they spawn that are still running when the script ends are cancelled.
+
+    A session made with a parent session sees the parent's definitions the same way, which lets
+    library scripts be loaded once and shared by the sessions of many scripts. Modules imported by
+    scripts are loaded into the root session, once even when its sessions import them from several threads.
+
+    With a ResultCache, programs that don't call builtins with side effects return the cached
+    result when they're run again with the same inputs. The session's definitions are expected
+    to stay the same once programs are run.
+    """
+
+    def __init__(self, code_cache_size=64, parent=None, quantum=1000, output=None, result_cache=None):
+        self.globals = SymbolTable(parent.globals if parent else global_symbol_table)
+        self.root = parent.root if parent else self # session that imported modules are loaded into
+        self.modules = {} # resolved path -> Module, used on the root session
+        self.modules_lock = threading.RLock() # held by the thread loading modules into the root session
+        self.importing = threading.local() # stack of the paths each thread is loading, to find circular imports
+        self.result_cache = result_cache
+        self.output = BufferedOutput() if output is None else output # flushed when a run ends
+        self.quantum = quantum # resumed nodes a task runs before others get a turn
+        self.loop = None
+        self.tasks = set() # tasks spawned by scripts that haven't finished
+        self.running = 0 # scripts and tasks running on the scheduler
+        self.blocked = set() # asyncio tasks of the running scripts that wait on a channel or task
+        self.deadlocked = set() # blocked tasks cancelled because of a deadlock
+        self.progress = 0 # counts the blocked scripts that went on and the tasks that finished
+        self.code_cache = LRUCache(code_cache_size) # (file name, source) -> AST
+        self.context = Context("<module>")
+        self.context.symbol_table = self.globals
+        self.context.session = self
+
+    # AST of the source, reused when the same source was compiled before
+    def compile(self, text, file_name):
+        key = (file_name, text)
+        node = self.code_cache.get(key)
+        if node is not None:
+            return node, None
+
+        # generate tokens
+        lexer = Lexer(text, file_name)
+        tokens, error = lexer.make_token()
+
+        if error:
+            return None, error
+
+        # generate AST
+        parser = Parser(tokens)
+        ast = parser.parse()
+
+        if ast.error:
+            return None, ast.error
+
+        self.code_cache.put(key, ast.node)
+        return ast.node, None
+
+    def run(self, text, file_name):
+        node, error = self.compile(text, file_name)
+
+        if error:
+            return None, error
+
+        if uses_tasks(node) and not running_loop():
+            return self.run_on_loop(self.run_async(text, file_name))
+
+        result = Interpreter.shared.visit(node, self.context)
+        self.output.flush()
+
+        return result.value, result.error
+
+    def event_loop(self):
+        if self.loop is None:
+            self.loop = asyncio.new_event_loop()
+
+        return self.loop
+
+    # result of a script's coroutine run on the session's own loop, the tasks it spawned that are still
+    # running when it ends are cancelled
+    def run_on_loop(self, coroutine):
+        loop = self.event_loop()
+
+        try:
+            return loop.run_until_complete(coroutine)
+        finally:
+            tasks = list(self.tasks)
+            for task in tasks:
+                task.cancel()
+
+            if tasks:
+                loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+
+    # result of a resumed script driven on the running loop, counted as running while it is
+    async def drive(self, resumed):
+        self.running += 1
+
+        try:
+            return await drive(resumed)
+        finally:
+            self.running -= 1
+
+    # task running a resumed script on the running loop, or the session's own
+    def spawn(self, resumed):
+        task = (running_loop() or self.event_loop()).create_task(drive(resumed))
+
+        self.running += 1
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+
+        return task
+
+    def task_done(self, task):
+        self.running -= 1
+        self.progress += 1
+        self.tasks.discard(task)
+
+    # fails the blocked waits when every running script is blocked. A script can be woken up without having
+    # run yet, so it's only a deadlock once nothing went on for DEADLOCK_ROUNDS turns of the loop
+    def check_deadlock(self, progress=None, rounds=0):
+        if not self.blocked or len(self.blocked) < self.running:
+            return
+
+        if progress != self.progress:
+            rounds = 0
+
+        if rounds < DEADLOCK_ROUNDS:
+            asyncio.get_running_loop().call_soon(self.check_deadlock, self.progress, rounds + 1)
+            return
+
+        for task in self.blocked - self.deadlocked:
+            self.deadlocked.add(task)
+            task.cancel()
+
+    # run on the running event loop, other tasks run while the script waits on async builtins
+    async def run_async(self, text, file_name):
+        node, error = self.compile(text, file_name)
+
+        if error:
+            return None, error
+
+        result = await self.drive(AsyncInterpreter(self.quantum).resume(node, self.context))
+        self.output.flush()
+
+        return result.value, result.error
+
+    def prepare(self, text, file_name):
+        node, error = self.compile(text, file_name)
+
+        if error:
+            return None, error
+
+        return Program(node.element_nodes, self), None
+
+    # module of the script at path, relative to the importing script. It's run the first time it's
+    # imported, on top of the root session's globals, and shared with every session of the same root.
+    # Sessions of the same root importing from other threads wait for the module to be loaded
+    def import_module(self, path, node, context):
+        root = self.root
+        resolved = resolve_import(path, node)
+
+        with root.modules_lock:
+            return self.load_module(path, resolved, node, context)
+
+    def load_module(self, path, resolved, node, context):
+        res = RuntimeResult()
+        root = self.root
+
+        module = root.modules.get(resolved)
+        if module is not None:
+            return res.success(module)
+
+        importing = getattr(root.importing, "paths", None)
+        if importing is None:
+            importing = root.importing.paths = []
+
+        if resolved in importing:
+            cycle = importing[importing.index(resolved):] + [resolved]
+            return res.failure(RuntimeError(node.pos_start, node.pos_end, "Circular import " + " -> ".join(os.path.basename(p) for p in cycle), context))
+
+        if os.path.splitext(resolved)[1] != ".ar":
+            return res.failure(RuntimeError(node.pos_start, node.pos_end, "Invalid file extension", context))
+
+        try:
+            with open(resolved, "r") as f:
+                script = f.read()
+        except OSError as ex:
+            return res.failure(RuntimeError(node.pos_start, node.pos_end, f"Failed to load module \"{path}\"\n" + str(ex), context))
+
+        # the module belongs to the root session, not to the session that happened to import it first
+        module_context = Context("<module>")
+        module_context.session = root
+        module_context.symbol_table = SymbolTable(root.globals)
+
+        statements, error = root.compile(script, resolved)
+
+        if not error:
+            importing.append(resolved)
+            try:
+                error = Interpreter.shared.visit(statements, module_context).error
+            finally:
+                importing.pop()
+
+        if error:
+            return res.failure(RuntimeError(node.pos_start, node.pos_end, f"Failed to import \"{path}\"\n" + error.as_string(), context))
+
+        module = Module(os.path.splitext(os.path.basename(resolved))[0], resolved, module_context.symbol_table)
+        root.modules[resolved] = module
+
+        return res.success(module)
+
+    def get(self, name):
+        value = self.globals.get(name)
+        return None if value is None else to_python(value)
+
+    def set(self, name, value):
+        self.globals.set(name, from_python(value, True))
+
+    def register_builtin(self, name, function, arg_types=None, lazy=False):
+        return register_builtin(name, function, arg_types, lazy, self.globals)
+
+
+class Program:
+    """Parsed script that can be run many times with different inputs.
+
+    Every run gets a fresh symbol table holding the bindings on top of the session's globals,
+    so inputs and definitions made by the script don't carry over to the next run.
+    """
+
+    def __init__(self, statement_nodes, session):
+        self.statement_nodes = statement_nodes
+        self.session = session
+        self.uses_tasks = any(uses_tasks(node) for node in statement_nodes)
+        self.impure_calls = None # builtins with side effects the program calls, found on the first cached run
+        self.source_digest = None
+
+    # looks for builtins with side effects used by the statements, by the session's functions they use
+    # and by the scripts they import. The sources of the program, of the functions it uses and
+    # of the imports, and the session's values it reads, are hashed so sessions defining them differently
+    # don't share results
+    def check_calls(self):
+        root = self.session.root
+        digest = hashlib.sha256()
+        impure_calls = set()
+        checked = set() # ids of the functions, names of the values, sources and paths of the imports already looked at
+        nodes = list(self.statement_nodes)
+
+        if nodes:
+            position = nodes[0].pos_start
+            checked.add((position.file_name, position.file_text))
+            digest.update(position.file_text.encode("utf-8", "surrogatepass"))
+
+        while nodes:
+            tree = nodes.pop()
+            names = used_names(tree)
+            impure_calls |= names & IMPURE_BUILTINS
+
+            # sorted so the digest is the same in every process
+            for name in sorted(names):
+                value = self.session.globals.get(name)
+                if isinstance(value, MemoFunction):
+                    value = value.function
+
+                if isinstance(value, Function) and id(value) not in checked:
+                    checked.add(id(value))
+                    nodes.append(value.body_node)
+
+                    position = value.body_node.pos_start
+                    if (position.file_name, position.file_text) not in checked:
+                        checked.add((position.file_name, position.file_text))
+                        digest.update(f"\0{position.file_name}\0".encode("utf-8", "surrogatepass") + position.file_text.encode("utf-8", "surrogatepass"))
+                elif isinstance(value, (Number, String, List, Map, Set, Bytes)) and ("value", name) not in checked:
+                    checked.add(("value", name))
+                    try:
+                        digest.update(f"\0{name}\0{canonical_text(value)}".encode("utf-8", "surrogatepass"))
+                    except TypeError:
+                        impure_calls.add(name) # holds functions or files, it can't be told apart from a different value
+
+            for node in walk_nodes(tree):
+                if isinstance(node, ImportNode):
+                    path = resolve_import(node.path_token.value, node)
+                    if path in checked:
+                        continue
+                    checked.add(path)
+
+                    try:
+                        with open(path, "r") as f:
+                            script = f.read()
+                    except OSError:
+                        impure_calls.add("import") # the import fails when it's run anyway
+                        continue
+
+                    module_node, error = root.compile(script, path)
+                    if error:
+                        impure_calls.add("import")
+                        continue
+
+                    digest.update(f"\0{path}\0".encode("utf-8", "surrogatepass") + script.encode("utf-8", "surrogatepass"))
+                    nodes.append(module_node)
+
+        self.impure_calls = impure_calls
+        self.source_digest = digest.hexdigest()
+
+    # key of running with the bindings in the session's result cache, None if the result can't be cached
+    def result_key(self, bindings):
+        if self.session.result_cache is None:
+            return None
+
+        if self.impure_calls is None:
+            self.check_calls()
+        if self.impure_calls:
+            return None
+
+        try:
+            inputs = canonical_text(bindings or {})
+        except TypeError:
+            return None
+
+        return hashlib.sha256(f"{self.source_digest}\0{inputs}".encode("utf-8", "surrogatepass")).hexdigest()
+
+    # results holding functions, files or iterators aren't kept
+    def store_result(self, key, value):
+        if is_plain_data(value):
+            self.session.result_cache.put(key, serialize.dumps(value))
+
+    # python value of a cached result, None if there's none or it can't be read
+    def cached_result(self, key):
+        data = self.session.result_cache.get(key)
+        if data is None:
+            return None
+
+        try:
+            value = serialize.loads(data)
+        except Exception: # written by another version or damaged, the decoder raises several kinds of errors
+            return None
+
+        return to_python(value) if is_plain_data(value) else None
+
+    def new_context(self, bindings):
+        context = Context("<module>")
+        context.session = self.session
+        context.symbol_table = SymbolTable(self.session.globals, {name: from_python(value, True) for name, value in (bindings or {}).items()})
+
+        return context
+
+    # python value of the last statement, or of a top level return
+    def run(self, bindings=None):
+        if self.uses_tasks and not running_loop():
+            return self.session.run_on_loop(self.run_async(bindings))
+
+        key = self.result_key(bindings)
+        if key is not None:
+            cached = self.cached_result(key)
+            if cached is not None:
+                return cached, None
+
+        context = self.new_context(bindings)
+        res = RuntimeResult()
+        value = Number.null
+        visit = Interpreter.shared.visit
+
+        for node in self.statement_nodes:
+            value = res.register(visit(node, context))
+
+            if res.should_return():
+                value = res.function_return_value or Number.null
+                break
+
+        self.session.output.flush()
+
+        if res.error:
+            return None, res.error
+
+        if key is not None:
+            self.store_result(key, value)
+
+        return to_python(value), None
+
+    async def run_async(self, bindings=None):
+        key = self.result_key(bindings)
+        if key is not None:
+            cached = self.cached_result(key)
+            if cached is not None:
+                return cached, None
+
+        context = self.new_context(bindings)
+        interpreter = AsyncInterpreter(self.session.quantum)
+        res = RuntimeResult()
+        value = Number.null
+
+        for node in self.statement_nodes:
+            value = res.register(await self.session.drive(interpreter.resume(node, context)))
+
+            if res.should_return():
+                value = res.function_return_value or Number.null
+                break
+
+        self.session.output.flush()
+
+        if res.error:
+            return None, res.error
+
+        if key is not None:
+            self.store_result(key, value)
+
+        return to_python(value), None
+
+
+# session used by run() and the REPL
+default_session = Session()
+
+
+def run(text, file_name):
+    return default_session.run(text, file_name)
 
-    if ast.error:
-        return None, ast.error
-    
-    interpreter = Interpreter()
-    root_context = Context("<module>")
-    root_context.symbol_table = global_symbol_table
-    result = interpreter.visit(ast.node, root_context)
 
-    return result.value, result.error
+def prepare(text, file_name):
+    return default_session.prepare(text, file_name)
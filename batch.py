@@ -0,0 +1,110 @@
+import argparse
+import math
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import arobal
+import serialize
+
+# session holding the library scripts, every script of a worker runs in a child session of it
+library_session = None
+
+
+# with a snapshot path, the libraries are restored from the snapshot made by the last run that loaded them
+def init_worker(library_paths, snapshot_path=None):
+    global library_session
+
+    if snapshot_path:
+        library_session, error = serialize.prelude_session(library_paths, snapshot_path)
+
+        if error:
+            raise RuntimeError(f"Failed to load libraries\n{error.as_string()}")
+        return
+
+    library_session = arobal.Session()
+
+    for path in library_paths:
+        with open(path, "r") as f:
+            _, error = library_session.run(f.read(), path)
+
+        if error:
+            raise RuntimeError(f"Failed to load library \"{path}\"\n{error.as_string()}")
+
+
+# (path, result repr, error text, seconds) of running one script in its own session
+def run_file(path):
+    start = time.perf_counter()
+
+    try:
+        with open(path, "r") as f:
+            script = f.read()
+    except OSError as ex:
+        return path, None, f"Failed to load script \"{path}\"\n{ex}", time.perf_counter() - start
+
+    result, error = arobal.Session(parent=library_session).run(script, path)
+    elapsed = time.perf_counter() - start
+
+    if error:
+        return path, None, error.as_string(), elapsed
+
+    return path, repr(result), None, elapsed
+
+
+# the .ar files of a directory, or the paths listed in a manifest file relative to it
+def script_paths(source):
+    if os.path.isdir(source):
+        return sorted(os.path.join(root, name) for root, _, names in os.walk(source) for name in names if name.endswith(".ar"))
+
+    base = os.path.dirname(source)
+    with open(source, "r") as f:
+        lines = [line.strip() for line in f]
+
+    return [os.path.join(base, line) for line in lines if line and not line.startswith("#")]
+
+
+def percentile(sorted_values, percent):
+    index = max(0, math.ceil(len(sorted_values) * percent / 100) - 1)
+    return sorted_values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run many AROBAL scripts in worker processes")
+    parser.add_argument("sources", nargs="+", metavar="source", help="directory of .ar files or manifest file listing one script path per line")
+    parser.add_argument("--lib", action="append", default=[], metavar="path", help="library script loaded once in every worker before the scripts, can be repeated")
+    parser.add_argument("--snapshot", metavar="path", help="file keeping the loaded libraries, so later runs start without parsing them")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=None, help="scripts sent to a worker at a time")
+    parser.add_argument("--verbose", action="store_true", help="print the result of every script")
+    args = parser.parse_args()
+
+    paths = [path for source in args.sources for path in script_paths(source)]
+    if not paths:
+        parser.error("no scripts to run")
+
+    chunk_size = args.chunk_size or max(1, len(paths) // (args.workers * 4))
+    latencies = []
+    failures = 0
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(args.workers, initializer=init_worker, initargs=(args.lib, args.snapshot)) as pool:
+        for path, result, error, elapsed in pool.map(run_file, paths, chunksize=chunk_size):
+            latencies.append(elapsed)
+
+            if error:
+                failures += 1
+                print(f"FAIL {path}\n{error}", file=sys.stderr)
+            elif args.verbose:
+                print(f"OK   {path}: {result}")
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(paths)} scripts, {failures} failed, {elapsed:.2f}s ({len(paths) / elapsed:,.1f} scripts/s with {args.workers} workers)")
+    print("latency " + ", ".join(f"p{p}: {percentile(latencies, p) * 1000:.2f}ms" for p in (50, 90, 99)) + f", max: {latencies[-1] * 1000:.2f}ms")
+
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+import argparse
+import os
+import pickle
+import subprocess
+import sys
+import tempfile
+import time
+
+import arobal
+import serialize
+
+
+def bench_call_overhead(calls):
+    script = f"function f(x) -> x\nfor i = 0 to {calls} then\n    f(i)\nend"
+    program_start = time.perf_counter()
+    result, error = arobal.run(script, "<benchmark>")
+    elapsed = time.perf_counter() - program_start
+
+    if error:
+        raise SystemExit(error.as_string())
+
+    # the same loop without the call, so only the cost of calling is reported
+    loop_script = f"function f(x) -> x\nfor i = 0 to {calls} then\n    i\nend"
+    loop_start = time.perf_counter()
+    arobal.run(loop_script, "<benchmark>")
+    loop_elapsed = time.perf_counter() - loop_start
+
+    print(f"call overhead: {calls} calls in {elapsed:.2f}s ({(elapsed - loop_elapsed) / calls * 1e6:.2f} us per call)")
+
+
+def bench_program_throughput(invocations):
+    script = "var total = price * qty\nif total > 100 then total * 0.9 else total"
+
+    program, error = arobal.prepare(script, "<benchmark>")
+    if error:
+        raise SystemExit(error.as_string())
+
+    program_start = time.perf_counter()
+    for i in range(invocations):
+        program.run({"price": i % 50, "qty": 3})
+    elapsed = time.perf_counter() - program_start
+
+    # lexing and parsing the script on every invocation, with a fresh session so the code cache doesn't apply
+    source_invocations = invocations // 10
+    source_start = time.perf_counter()
+    for i in range(source_invocations):
+        session = arobal.Session(code_cache_size=0)
+        session.set("price", i % 50)
+        session.set("qty", 3)
+        session.run(script, "<benchmark>")
+    source_elapsed = (time.perf_counter() - source_start) / source_invocations * invocations
+
+    print(f"program throughput: {invocations} runs in {elapsed:.2f}s ({invocations / elapsed:,.0f} runs/s, {invocations / source_elapsed:,.0f} runs/s parsing every time)")
+
+
+def bench_marshalling(size):
+    data = list(range(size))
+
+    start = time.perf_counter()
+    converted = arobal.from_python(data)
+    convert_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    view = arobal.from_python(data, lazy=True)
+    view_elapsed = time.perf_counter() - start
+
+    start = time.perf_counter()
+    arobal.to_python(converted)
+    back_elapsed = time.perf_counter() - start
+
+    print(f"marshalling {size} numbers: converting {convert_elapsed * 1000:.2f}ms, view {view_elapsed * 1000:.3f}ms, back to python {back_elapsed * 1000:.2f}ms")
+
+
+def bench_serialization(records):
+    script = open("example.ar", "r").read()
+    program, error = arobal.prepare(script, "example.ar")
+    if error:
+        raise SystemExit(error.as_string())
+
+    payloads = {
+        "values": arobal.from_python([{"id": i, "name": f"item {i % 100}", "price": i * 0.5, "tags": ["a", "b"]} for i in range(records)]),
+        "ast": program.statement_nodes,
+    }
+
+    for name, payload in payloads.items():
+        start = time.perf_counter()
+        data = serialize.dumps(payload)
+        encode_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        serialize.loads(data)
+        decode_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pickled = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+        pickle_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        pickle.loads(pickled)
+        unpickle_elapsed = time.perf_counter() - start
+
+        print(f"serializing {name}: {len(data):,} bytes, encode {encode_elapsed * 1000:.2f}ms, decode {decode_elapsed * 1000:.2f}ms"
+              f" (pickle {len(pickled):,} bytes, {pickle_elapsed * 1000:.2f}ms, {unpickle_elapsed * 1000:.2f}ms)")
+
+
+def bench_startup(functions, starts=10):
+    # a prelude of small helper functions, like the library scripts batch workers load
+    prelude = "\n".join(f"function helper_{i}(x, y)\n    var total = x * {i} + y\n    return if total > 100 then total - 100 else total\nend" for i in range(functions))
+
+    with tempfile.TemporaryDirectory() as directory:
+        prelude_path = os.path.join(directory, "prelude.ar")
+        snapshot_path = os.path.join(directory, "prelude.arb")
+        with open(prelude_path, "w") as f:
+            f.write(prelude)
+
+        load = f"import serialize\n_, error = serialize.prelude_session([{prelude_path!r}], {snapshot_path!r})\nassert error is None"
+        here = os.path.dirname(os.path.abspath(__file__))
+
+        def start(code, before=None):
+            elapsed = 0
+            for _ in range(starts):
+                if before:
+                    before()
+                start = time.perf_counter()
+                subprocess.run([sys.executable, "-c", code], cwd=here, check=True)
+                elapsed += time.perf_counter() - start
+            return elapsed / starts
+
+        def remove_snapshot():
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+        python_elapsed = start("pass")
+        import_elapsed = start("import arobal")
+        cold_elapsed = start(load, remove_snapshot)
+        start(load) # writes the snapshot
+        warm_elapsed = start(load)
+
+    print(f"startup with a {functions} function prelude: python {python_elapsed * 1000:.1f}ms, import {import_elapsed * 1000:.1f}ms,"
+          f" cold {cold_elapsed * 1000:.1f}ms, warm from snapshot {warm_elapsed * 1000:.1f}ms")
+
+
+BENCHMARKS = {
+    "calls": lambda args: bench_call_overhead(args.calls),
+    "program": lambda args: bench_program_throughput(args.invocations),
+    "marshal": lambda args: bench_marshalling(args.size),
+    "serialize": lambda args: bench_serialization(args.records),
+    "startup": lambda args: bench_startup(args.functions),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="AROBAL interpreter benchmarks")
+    parser.add_argument("benchmarks", nargs="*", metavar="benchmark", help=f"benchmarks to run ({', '.join(BENCHMARKS)}), all of them by default")
+    parser.add_argument("--calls", type=int, default=1_000_000, help="number of calls for the call overhead benchmark")
+    parser.add_argument("--invocations", type=int, default=100_000, help="number of runs for the program throughput benchmark")
+    parser.add_argument("--size", type=int, default=1_000_000, help="number of elements for the marshalling benchmark")
+    parser.add_argument("--records", type=int, default=10_000, help="number of records for the serialization benchmark")
+    parser.add_argument("--functions", type=int, default=300, help="number of functions in the prelude of the startup benchmark")
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if name not in BENCHMARKS:
+            parser.error(f"unknown benchmark '{name}'")
+
+    for name in args.benchmarks or BENCHMARKS:
+        BENCHMARKS[name](args)
@@ -1,5 +1,7 @@
 import arobal
 
+output = arobal.default_session.output
+
 while True:
     text = input("AROBAL% ")
     if text.strip() == "":
@@ -7,9 +9,11 @@ while True:
     result, error = arobal.run(text, "<stdin>")
 
     if error:
-        print(error.as_string())
+        output.write(error.as_string() + "\n")
     elif result:
         if len(result.elements) == 1:
-            print(repr(result.elements[0]))
+            output.write(repr(result.elements[0]) + "\n")
         else:
-            print(repr(result))
+            output.write(repr(result) + "\n")
+
+    output.flush()
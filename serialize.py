@@ -0,0 +1,577 @@
+"""Compact binary encoding for AROBAL values, parsed ASTs and prepared programs.
+
+A stream starts with MAGIC and a version byte, followed by any number of records that each hold
+one encoded object. Every string (values, names, file names and source text) is written once per
+stream and referred to by its index after that, and so are positions and the field names of each
+kind of node, so an AST carries its source text once instead of with every token the way pickle
+does. Positions are written as the difference from the previous one. Values are written without
+their positions and contexts, except functions, which need them for tracebacks.
+
+    data = dumps(value)
+    value = loads(data)
+
+    encoder = Encoder(stream)
+    for value in values:
+        encoder.encode(value)
+
+    for value in Decoder(stream):
+        ...
+
+Decoding corrupt data raises ValueError, and a stream ending in the middle of a record EOFError.
+
+prelude_session runs prelude scripts once and keeps their definitions in a snapshot file, which
+later processes restore instead of lexing, parsing and running the scripts again.
+"""
+
+import hashlib
+import io
+import os
+import struct
+
+import arobal
+
+MAGIC = b"ARB"
+VERSION = 2
+
+# record tags
+(
+    NONE, TRUE, FALSE, INT, FLOAT, STR, TUPLE, PY_LIST,
+    NUMBER_INT, NUMBER_FLOAT, STRING, LIST, MAP, SET, BYTES, FUNCTION, BUILTIN,
+    OBJECT, POSITION, POSITION_REF, PROGRAM,
+) = range(21)
+
+# attributes caching facts about a node, they are worked out again after decoding
+DERIVED_ATTRIBUTES = {"can_suspend", "uses_tasks"}
+
+double = struct.Struct("<d")
+
+
+class Encoder:
+    def __init__(self, stream):
+        self.stream = stream
+        self.out = bytearray()
+        self.strings = {} # string -> index in the stream's string table
+        self.positions = {} # id of position -> index
+        self.position_objects = [] # keeps the positions alive so their ids stay unique
+        self.sources = {} # (file name, file text) -> index
+        self.last_position = (0, 0) # index and line of the last position written
+        self.shapes = {} # (class, field names) -> index
+
+        self.dispatch = {
+            type(None): self.encode_none,
+            bool: self.encode_bool,
+            int: self.encode_int,
+            float: self.encode_float,
+            str: self.encode_str,
+            tuple: self.encode_tuple,
+            list: self.encode_list,
+            arobal.Number: self.encode_number,
+            arobal.String: self.encode_string,
+            arobal.List: self.encode_value_list,
+            arobal.Map: self.encode_map,
+            arobal.Set: self.encode_set,
+            arobal.Bytes: self.encode_bytes,
+            arobal.Function: self.encode_function,
+            arobal.BuiltinFunction: self.encode_builtin,
+            arobal.Position: self.encode_position,
+            arobal.Token: self.encode_object,
+            arobal.Program: self.encode_program,
+        }
+
+        stream.write(MAGIC + bytes([VERSION]))
+
+    # writes one record
+    def encode(self, obj):
+        self.value(obj)
+        self.stream.write(self.out)
+        self.out = bytearray()
+
+    def value(self, obj):
+        method = self.dispatch.get(type(obj))
+
+        if method is None:
+            if not type(obj).__name__.endswith("Node"):
+                raise TypeError(f"Can't serialize {type(obj).__name__}")
+            method = self.encode_object
+
+        method(obj)
+
+    def varint(self, number):
+        out = self.out
+
+        while number > 0x7F:
+            out.append((number & 0x7F) | 0x80)
+            number >>= 7
+
+        out.append(number)
+
+    def signed(self, number):
+        self.varint(number * 2 if number >= 0 else -number * 2 - 1)
+
+    # a string the first time it's written, its index in the string table after that
+    def string(self, text):
+        index = self.strings.get(text)
+
+        if index is None:
+            self.strings[text] = len(self.strings)
+            data = text.encode("utf-8", "surrogatepass")
+            self.varint(len(data) * 2)
+            self.out += data
+        else:
+            self.varint(index * 2 + 1)
+
+    def encode_none(self, obj):
+        self.out.append(NONE)
+
+    def encode_bool(self, obj):
+        self.out.append(TRUE if obj else FALSE)
+
+    def encode_int(self, obj):
+        self.out.append(INT)
+        self.signed(obj)
+
+    def encode_float(self, obj):
+        self.out.append(FLOAT)
+        self.out += double.pack(obj)
+
+    def encode_str(self, obj):
+        self.out.append(STR)
+        self.string(obj)
+
+    def encode_tuple(self, obj):
+        self.out.append(TUPLE)
+        self.items(obj)
+
+    def encode_list(self, obj):
+        self.out.append(PY_LIST)
+        self.items(obj)
+
+    def items(self, items):
+        self.varint(len(items))
+        for item in items:
+            self.value(item)
+
+    def encode_number(self, obj):
+        if isinstance(obj.value, float):
+            self.out.append(NUMBER_FLOAT)
+            self.out += double.pack(obj.value)
+        else:
+            self.out.append(NUMBER_INT)
+            self.signed(obj.value)
+
+    def encode_string(self, obj):
+        self.out.append(STRING)
+        self.string(obj.value)
+
+    def encode_value_list(self, obj):
+        self.out.append(LIST)
+        self.items(obj.elements)
+
+    def encode_map(self, obj):
+        self.out.append(MAP)
+        self.varint(len(obj.entries))
+
+        for key, value in obj.entries.values():
+            self.value(key)
+            self.value(value)
+
+    def encode_set(self, obj):
+        self.out.append(SET)
+        self.items(list(obj.members.values()))
+
+    def encode_bytes(self, obj):
+        self.out.append(BYTES)
+        self.varint(obj.length())
+        self.out += obj.view()
+
+    def encode_function(self, obj):
+        self.out.append(FUNCTION)
+        self.string(obj.name)
+        self.varint(len(obj.arg_names))
+        for arg_name in obj.arg_names:
+            self.string(arg_name)
+        self.out.append(int(obj.should_auto_return) | int(obj.is_generator) << 1)
+        self.value(obj.body_node)
+        self.value(obj.pos_start)
+        self.value(obj.pos_end)
+
+    # builtins are sent by name, only the ones defined by arobal exist in every process
+    def encode_builtin(self, obj):
+        if obj.spec is not arobal.BuiltinFunction.registry.get(obj.name):
+            raise TypeError(f"Can't serialize {obj}, it's registered by the host application")
+
+        self.out.append(BUILTIN)
+        self.string(obj.name)
+
+    def encode_position(self, obj):
+        index = self.positions.get(id(obj))
+
+        if index is not None:
+            self.out.append(POSITION_REF)
+            self.varint(index)
+            return
+
+        self.positions[id(obj)] = len(self.position_objects)
+        self.position_objects.append(obj)
+
+        self.out.append(POSITION)
+
+        source = (obj.file_name, obj.file_text)
+        source_index = self.sources.get(source)
+        if source_index is None:
+            self.sources[source] = len(self.sources)
+            self.varint(0)
+            self.string(obj.file_name)
+            self.string(obj.file_text)
+        else:
+            self.varint(source_index + 1)
+
+        last_index, last_line = self.last_position
+        self.signed(obj.index - last_index)
+        self.signed(obj.line - last_line)
+        self.signed(obj.col)
+        self.last_position = (obj.index, obj.line)
+
+    # nodes and tokens, as their shape (class name and field names) and field values
+    def encode_object(self, obj):
+        fields = vars(obj)
+        names = tuple(name for name in fields if name not in DERIVED_ATTRIBUTES)
+
+        self.out.append(OBJECT)
+
+        shape = (type(obj), names)
+        index = self.shapes.get(shape)
+        if index is None:
+            self.shapes[shape] = len(self.shapes)
+            self.varint(0)
+            self.string(type(obj).__name__)
+            self.varint(len(names))
+            for name in names:
+                self.string(name)
+        else:
+            self.varint(index + 1)
+
+        for name in names:
+            self.value(fields[name])
+
+    def encode_program(self, obj):
+        self.out.append(PROGRAM)
+        self.items(obj.statement_nodes)
+
+
+class Decoder:
+    # programs are decoded into the session, the default session if it's None
+    def __init__(self, stream, session=None):
+        self.stream = stream
+        self.session = session or arobal.default_session
+        self.buffer = b""
+        self.offset = 0
+        self.strings = []
+        self.positions = []
+        self.sources = []
+        self.last_position = (0, 0)
+        self.shapes = [] # (class, field names)
+
+        self.dispatch = {
+            NONE: lambda: None,
+            TRUE: lambda: True,
+            FALSE: lambda: False,
+            INT: self.signed,
+            FLOAT: self.float,
+            STR: self.string,
+            TUPLE: lambda: tuple(self.items()),
+            PY_LIST: self.items,
+            NUMBER_INT: lambda: arobal.Number(self.signed()),
+            NUMBER_FLOAT: lambda: arobal.Number(self.float()),
+            STRING: lambda: arobal.String(self.string()),
+            LIST: lambda: arobal.List(self.items()),
+            MAP: self.decode_map,
+            SET: self.decode_set,
+            BYTES: lambda: arobal.Bytes(self.read(self.varint())),
+            FUNCTION: self.decode_function,
+            BUILTIN: self.decode_builtin,
+            OBJECT: self.decode_object,
+            POSITION: self.decode_position,
+            POSITION_REF: lambda: self.entry(self.positions, self.varint(), "position"),
+            PROGRAM: self.decode_program,
+        }
+
+        header = self.read(len(MAGIC) + 1)
+        if header[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not an AROBAL serialized stream")
+        if header[-1] != VERSION:
+            raise ValueError(f"Unsupported serialization version {header[-1]}, this version reads {VERSION}")
+
+    # reads one record, EOFError at the end of the stream
+    def decode(self):
+        return self.value()
+
+    def __iter__(self):
+        while self.offset < len(self.buffer) or self.fill(1, at_end_ok=True):
+            yield self.value()
+
+    # buffers at least size bytes, pipes and sockets can return fewer than asked for from a read
+    def fill(self, size, at_end_ok=False):
+        pieces = [self.buffer[self.offset:]]
+        buffered = len(pieces[0])
+        self.offset = 0
+
+        while buffered < size:
+            data = self.stream.read(max(size - buffered, 65536))
+            if not data:
+                break
+            pieces.append(data)
+            buffered += len(data)
+
+        self.buffer = b"".join(pieces)
+
+        if len(self.buffer) < size:
+            if at_end_ok and not self.buffer:
+                return False
+            raise EOFError("Serialized stream ended in the middle of a record")
+
+        return True
+
+    def read(self, size):
+        if self.offset + size > len(self.buffer):
+            self.fill(size)
+
+        data = self.buffer[self.offset:self.offset + size]
+        self.offset += size
+        return data
+
+    def byte(self):
+        if self.offset >= len(self.buffer):
+            self.fill(1)
+
+        byte = self.buffer[self.offset]
+        self.offset += 1
+        return byte
+
+    def value(self):
+        if self.offset >= len(self.buffer):
+            self.fill(1)
+
+        tag = self.buffer[self.offset]
+        self.offset += 1
+        method = self.dispatch.get(tag)
+
+        if method is None:
+            raise ValueError(f"Unknown tag {tag} in serialized stream")
+
+        return method()
+
+    def varint(self):
+        # most numbers, lengths and string indexes fit in one byte
+        if self.offset < len(self.buffer) and self.buffer[self.offset] < 0x80:
+            self.offset += 1
+            return self.buffer[self.offset - 1]
+
+        number = 0
+        shift = 0
+
+        while True:
+            byte = self.byte()
+            number |= (byte & 0x7F) << shift
+            if byte < 0x80:
+                return number
+            shift += 7
+
+    def signed(self):
+        number = self.varint()
+        return number // 2 if number % 2 == 0 else -(number + 1) // 2
+
+    def float(self):
+        return double.unpack(self.read(8))[0]
+
+    # item of one of the stream's tables, ValueError for an index past what the stream defined so far
+    def entry(self, table, index, kind):
+        if not 0 <= index < len(table):
+            raise ValueError(f"Serialized stream refers to {kind} {index}, it only defined {len(table)}")
+
+        return table[index]
+
+    def string(self):
+        number = self.varint()
+
+        if number % 2:
+            return self.entry(self.strings, number // 2, "string")
+
+        text = self.read(number // 2).decode("utf-8", "surrogatepass")
+        self.strings.append(text)
+        return text
+
+    def items(self):
+        return [self.value() for _ in range(self.varint())]
+
+    # hash key of a decoded map key or set member
+    def hash_key(self, value):
+        hash_key = value.hash_key() if isinstance(value, arobal.Value) else None
+
+        if hash_key is None:
+            raise ValueError(f"Serialized stream has {type(value).__name__} {value!r} as a map key or set member")
+
+        return hash_key
+
+    def decode_map(self):
+        entries = {}
+
+        for _ in range(self.varint()):
+            key = self.value()
+            entries[self.hash_key(key)] = (key, self.value())
+
+        return arobal.Map(entries)
+
+    def decode_set(self):
+        return arobal.Set({self.hash_key(member): member for member in self.items()})
+
+    def decode_function(self):
+        name = self.string()
+        arg_names = [self.string() for _ in range(self.varint())]
+        flags = self.byte()
+
+        function = arobal.Function(name, self.value(), arg_names, bool(flags & 1), bool(flags & 2))
+        function.set_pos(self.value(), self.value())
+        # like any value read from a variable, it takes the context it's used in
+        function.set_context(self.session.context)
+
+        return function
+
+    def decode_builtin(self):
+        name = self.string()
+
+        if name not in arobal.BuiltinFunction.registry:
+            raise ValueError(f"Unknown builtin function '{name}' in serialized stream")
+
+        return arobal.BuiltinFunction(name)
+
+    def decode_position(self):
+        position = arobal.Position.__new__(arobal.Position)
+        self.positions.append(position)
+
+        source_index = self.varint()
+        if source_index == 0:
+            self.sources.append((self.string(), self.string()))
+        position.file_name, position.file_text = self.entry(self.sources, source_index - 1, "source")
+
+        last_index, last_line = self.last_position
+        position.index = last_index + self.signed()
+        position.line = last_line + self.signed()
+        position.col = self.signed()
+        self.last_position = (position.index, position.line)
+
+        return position
+
+    # only tokens and AST nodes are created from class names
+    def decode_object(self):
+        shape_index = self.varint()
+
+        if shape_index == 0:
+            class_name = self.string()
+            cls = getattr(arobal, class_name, None)
+
+            if not (class_name == "Token" or class_name.endswith("Node")) or not isinstance(cls, type):
+                raise ValueError(f"Can't create '{class_name}' from serialized stream")
+
+            self.shapes.append((cls, [self.string() for _ in range(self.varint())]))
+
+        cls, names = self.entry(self.shapes, shape_index - 1, "shape")
+        obj = cls.__new__(cls)
+        fields = obj.__dict__
+
+        for name in names:
+            fields[name] = self.value()
+
+        return obj
+
+
+    def decode_program(self):
+        statements = self.items()
+
+        if not all(type(node).__name__.endswith("Node") for node in statements):
+            raise ValueError("Serialized program has statements that aren't nodes")
+
+        return arobal.Program(statements, self.session)
+
+
+def dumps(obj):
+    stream = io.BytesIO()
+    Encoder(stream).encode(obj)
+    return stream.getvalue()
+
+
+def loads(data, session=None):
+    return Decoder(io.BytesIO(data), session).decode()
+
+
+# changes when the preludes, the interpreter or the format change, so stale snapshots aren't used
+def snapshot_key(prelude_paths, sources):
+    digest = hashlib.sha256(f"{VERSION} {os.path.getmtime(arobal.__file__)}".encode())
+
+    for path, source in zip(prelude_paths, sources):
+        digest.update(f"\0{os.path.abspath(path)}\0{len(source)}\0".encode())
+        digest.update(source.encode("utf-8", "surrogatepass"))
+
+    return digest.hexdigest()
+
+
+def save_snapshot(session, path, key):
+    temp_path = f"{path}.{os.getpid()}.tmp"
+
+    try:
+        with open(temp_path, "wb") as f:
+            encoder = Encoder(f)
+            encoder.encode(key)
+            encoder.encode(list(session.globals.symbols.items()))
+
+        os.replace(temp_path, path) # so other processes never read a half written snapshot
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# puts the snapshot's definitions in the session, False if there's no snapshot made with the key
+def load_snapshot(session, path, key):
+    try:
+        with open(path, "rb") as f:
+            decoder = Decoder(f, session)
+            if decoder.decode() != key:
+                return False
+
+            symbols = decoder.decode()
+    except Exception: # missing, truncated or damaged, the decoder raises several kinds of errors
+        return False
+
+    # definitions are only restored when the whole snapshot makes sense, else the preludes are run
+    if not isinstance(symbols, list) or not all(isinstance(item, tuple) and len(item) == 2 and isinstance(item[0], str) and isinstance(item[1], arobal.Value) for item in symbols):
+        return False
+
+    session.globals.symbols.update(symbols)
+    return True
+
+
+# (session, error) with the prelude scripts loaded, from the snapshot when it was made from the same
+# scripts. Preludes holding values that can't be serialized, like files or modules, are run every time
+def prelude_session(prelude_paths, snapshot_path, session=None):
+    session = session or arobal.Session()
+    sources = []
+
+    for path in prelude_paths:
+        with open(path, "r") as f:
+            sources.append(f.read())
+
+    key = snapshot_key(prelude_paths, sources)
+    if load_snapshot(session, snapshot_path, key):
+        return session, None
+
+    for path, source in zip(prelude_paths, sources):
+        _, error = session.run(source, path)
+        if error:
+            return session, error
+
+    try:
+        save_snapshot(session, snapshot_path, key)
+    except (TypeError, OSError):
+        pass
+
+    return session, None
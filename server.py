@@ -0,0 +1,289 @@
+import argparse
+import json
+import os
+import resource
+import select
+import signal
+import socket
+import sys
+import time
+
+import arobal
+
+# Protocol: one JSON object per line each way
+#   request:  {"script": "rules/price.ar", "inputs": {"price": 10}}
+#   response: {"result": 50, "error": null}
+# the last response of a worker about to be replaced also has "closing": true
+
+
+class ScriptServer:
+    """Prefork server running AROBAL scripts from a directory.
+
+    The parent loads the library scripts and prepares every script before forking, so workers
+    start with everything parsed and only run the prepared programs. Workers exit after
+    max_jobs requests or once their memory use passes max_memory, and are replaced. Workers
+    failing right after they start are replaced after a growing delay, and the server gives
+    up once max_crashes of them failed in a row.
+    """
+
+    crash_window = 1.0 # seconds, a worker failing sooner than this after starting counts as a crash
+    crash_backoff = 0.1 # seconds before replacing a crashed worker, doubled for each crash in a row
+    max_crashes = 10
+
+    def __init__(self, listener, scripts_dir, library_paths=(), workers=4, max_jobs=1000, max_memory_mb=None):
+        self.listener = listener
+        self.scripts_dir = os.path.abspath(scripts_dir)
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.max_memory_mb = max_memory_mb
+        self.children = {} # pid -> time the worker started
+
+        self.session = arobal.Session()
+        for path in library_paths:
+            with open(path, "r") as f:
+                _, error = self.session.run(f.read(), path)
+
+            if error:
+                raise SystemExit(f"Failed to load library \"{path}\"\n{error.as_string()}")
+
+        self.programs = {}
+        for root, _, names in os.walk(self.scripts_dir):
+            for name in names:
+                if name.endswith(".ar"):
+                    self.program(os.path.relpath(os.path.join(root, name), self.scripts_dir))
+
+    # prepared program of a script in the scripts directory, and the error if it can't be loaded.
+    # Only scripts that load are kept, so a script fixed on disk is picked up by the next request
+    # and requests for names that don't exist don't fill the dict
+    def program(self, name):
+        if name in self.programs:
+            return self.programs[name], None
+
+        path = os.path.normpath(os.path.join(self.scripts_dir, name))
+        if not path.startswith(self.scripts_dir + os.sep) or not path.endswith(".ar"):
+            return None, f"Invalid script name \"{name}\""
+
+        try:
+            with open(path, "r") as f:
+                script = f.read()
+        except OSError as ex:
+            return None, f"Failed to load script \"{name}\"\n{ex}"
+
+        program, error = self.session.prepare(script, name)
+        if error:
+            return None, error.as_string()
+
+        self.programs[name] = program
+        return program, None
+
+    def handle(self, request):
+        try:
+            request = json.loads(request)
+            program, error = self.program(request["script"])
+            inputs = request.get("inputs") or {}
+
+            if not isinstance(inputs, dict):
+                raise TypeError("inputs must be an object")
+        except (ValueError, KeyError, TypeError, AttributeError) as ex:
+            return {"result": None, "error": f"Invalid request: {ex}"}
+
+        if error:
+            return {"result": None, "error": error}
+
+        try:
+            result, error = program.run(inputs)
+        except Exception as ex: # a failing request mustn't take the worker down with it
+            return {"result": None, "error": f"Failed to run script: {ex}"}
+
+        if error:
+            return {"result": None, "error": error.as_string()}
+
+        return {"result": result, "error": None}
+
+    # response line, sets and iterators become lists
+    def encode(self, response):
+        try:
+            return json.dumps(response, default=list).encode() + b"\n"
+        except Exception as ex: # results like functions have no JSON form
+            response = {**response, "result": None, "error": f"Can't send result: {ex}"}
+            return json.dumps(response).encode() + b"\n"
+
+    def should_recycle(self, jobs):
+        # max rss is in kilobytes on linux
+        memory_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        return jobs >= self.max_jobs or (self.max_memory_mb and memory_mb >= self.max_memory_mb)
+
+    # a worker only exits between requests, after answering the last one it read
+    def worker(self):
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        jobs = 0
+
+        while True:
+            connection, _ = self.listener.accept()
+
+            with connection, connection.makefile("rwb") as stream:
+                for line in stream:
+                    response = self.handle(line)
+
+                    jobs += 1
+                    closing = self.should_recycle(jobs)
+                    if closing:
+                        response["closing"] = True
+
+                    stream.write(self.encode(response))
+                    stream.flush()
+
+                    if closing:
+                        os._exit(0)
+
+    def spawn(self):
+        pid = os.fork()
+
+        if pid == 0:
+            try:
+                self.worker()
+            finally:
+                os._exit(1)
+
+        self.children[pid] = time.monotonic()
+
+    def serve_forever(self):
+        def stop(signum, frame):
+            raise SystemExit(0)
+
+        signal.signal(signal.SIGTERM, stop)
+
+        try:
+            for _ in range(self.workers):
+                self.spawn()
+
+            # replace workers as they exit, waiting longer each time they fail right after starting
+            crashes = 0
+            while True:
+                pid, status = os.wait()
+                started = self.children.pop(pid, None)
+
+                if status != 0 and started is not None and time.monotonic() - started < self.crash_window:
+                    crashes += 1
+                    if crashes >= self.max_crashes:
+                        raise SystemExit(f"Workers failed {crashes} times in a row right after starting, stopping")
+                    time.sleep(self.crash_backoff * 2 ** (crashes - 1))
+                else:
+                    crashes = 0
+
+                self.spawn()
+        finally:
+            for pid in self.children:
+                os.kill(pid, signal.SIGTERM)
+
+
+class Client:
+    """Blocking client for a ScriptServer, one connection for many calls."""
+
+    def __init__(self, unix_path=None, host="127.0.0.1", port=8765):
+        self.unix_path = unix_path
+        self.address = (host, port)
+        self.connect()
+
+    def connect(self):
+        if self.unix_path:
+            self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.socket.connect(self.unix_path)
+        else:
+            self.socket = socket.create_connection(self.address)
+
+        self.stream = self.socket.makefile("rwb")
+        self.closing = False
+
+    # (result, error text) of running a script with the inputs
+    def call(self, script, inputs=None):
+        request = json.dumps({"script": script, "inputs": inputs or {}}).encode() + b"\n"
+
+        # a worker being replaced says so in its last response, and idle connections may have been closed,
+        # either way a new connection is made before sending. A request that was sent and got no answer
+        # may have made the worker fail, it isn't sent again
+        if self.closing or self.closed_by_server():
+            self.close()
+            self.connect()
+
+        try:
+            self.stream.write(request)
+            self.stream.flush()
+            line = self.stream.readline()
+        except (BrokenPipeError, ConnectionResetError):
+            line = b""
+
+        if not line:
+            self.close()
+            self.connect()
+            raise ConnectionError("Server closed the connection without answering")
+
+        response = json.loads(line)
+        self.closing = response.get("closing", False)
+
+        return response["result"], response["error"]
+
+    def closed_by_server(self):
+        readable, _, _ = select.select([self.socket], [], [], 0)
+        if not readable:
+            return False
+
+        try:
+            return not self.socket.recv(1, socket.MSG_PEEK)
+        except ConnectionResetError:
+            return True
+
+    def close(self):
+        try:
+            self.stream.close()
+        except OSError:
+            pass # the request left in the buffer was never going to be read
+
+        self.socket.close()
+
+
+def listen(unix_path, host, port):
+    if unix_path:
+        if os.path.exists(unix_path):
+            os.unlink(unix_path)
+
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listener.bind(unix_path)
+    else:
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listener.bind((host, port))
+
+    listener.listen(128)
+    return listener
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve AROBAL scripts from warm worker processes")
+    parser.add_argument("--unix", metavar="path", help="listen on a unix socket instead of TCP")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scripts", default=".", metavar="dir", help="directory the requested scripts are in")
+    parser.add_argument("--lib", action="append", default=[], metavar="path", help="library script loaded before forking, can be repeated")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="number of worker processes")
+    parser.add_argument("--max-jobs", type=int, default=1000, help="requests a worker handles before it's replaced")
+    parser.add_argument("--max-memory", type=int, default=None, metavar="MB", help="memory use after which a worker is replaced")
+    parser.add_argument("--call", metavar="script", help="send one request to a running server and print the response")
+    parser.add_argument("--inputs", default="{}", help="JSON object of inputs for --call")
+    args = parser.parse_args()
+
+    if args.call:
+        client = Client(args.unix, args.host, args.port)
+        result, error = client.call(args.call, json.loads(args.inputs))
+        client.close()
+
+        print(error or json.dumps(result))
+        return 1 if error else 0
+
+    server = ScriptServer(listen(args.unix, args.host, args.port), args.scripts, args.lib, args.workers, args.max_jobs, args.max_memory)
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    sys.exit(main())